@@ -33,21 +33,54 @@
 # THE SOFTWARE.
 
 import time
-from ustruct import unpack, unpack_from
+try:
+    from ustruct import unpack, unpack_from
+except ImportError:
+    from struct import unpack, unpack_from
 from array import array
 
 # BME280 default address.
 BME280_I2CADDR = 0x76
 
 # Operating Modes
+BME280_OSAMPLE_SKIP = 0
 BME280_OSAMPLE_1 = 1
 BME280_OSAMPLE_2 = 2
 BME280_OSAMPLE_4 = 3
 BME280_OSAMPLE_8 = 4
 BME280_OSAMPLE_16 = 5
 
+# IIR filter coefficients
+BME280_FILTER_OFF = 0
+BME280_FILTER_2 = 1
+BME280_FILTER_4 = 2
+BME280_FILTER_8 = 3
+BME280_FILTER_16 = 4
+
+# Standby time between measurements in normal mode
+BME280_STANDBY_0_5 = 0
+BME280_STANDBY_62_5 = 1
+BME280_STANDBY_125 = 2
+BME280_STANDBY_250 = 3
+BME280_STANDBY_500 = 4
+BME280_STANDBY_1000 = 5
+BME280_STANDBY_10 = 6
+BME280_STANDBY_20 = 7
+
+# standby times in microseconds, indexed by BME280_STANDBY_* value
+_STANDBY_US = (500, 62500, 125000, 250000, 500000, 1000000, 10000, 20000)
+
+BME280_SLEEP_MODE = 0
+BME280_FORCED_MODE = 1
+BME280_NORMAL_MODE = 3
+
 BME280_REGISTER_CONTROL_HUM = 0xF2
+BME280_REGISTER_STATUS = 0xF3
 BME280_REGISTER_CONTROL = 0xF4
+BME280_REGISTER_CONFIG = 0xF5
+
+# status register bit set while conversion is running
+BME280_STATUS_MEASURING = 0x08
 
 
 class BME280:
@@ -56,7 +89,24 @@ class BME280:
                  mode=BME280_OSAMPLE_1,
                  address=BME280_I2CADDR,
                  i2c=None,
+                 osrs_t=None,
+                 osrs_p=None,
+                 osrs_h=None,
+                 iir_filter=BME280_FILTER_OFF,
+                 standby=BME280_STANDBY_0_5,
+                 normal_mode=False,
                  **kwargs):
+        """ Args:
+                mode: oversampling used for channels not given separately
+                osrs_t, osrs_p, osrs_h: temperature, pressure, humidity
+                oversampling, one of BME280_OSAMPLE_*, SKIP disables channel
+                iir_filter: one of BME280_FILTER_*
+                standby: one of BME280_STANDBY_*, time between measurements
+                in normal mode
+                normal_mode: sensor measures continuously, reads only fetch
+                the latest result. Otherwise every read triggers one forced
+                measurement
+        """
         # Check that mode is valid.
         if mode not in [BME280_OSAMPLE_1, BME280_OSAMPLE_2, BME280_OSAMPLE_4,
                         BME280_OSAMPLE_8, BME280_OSAMPLE_16]:
@@ -65,6 +115,28 @@ class BME280:
                 'BME280_ULTRALOWPOWER, BME280_STANDARD, BME280_HIGHRES, or '
                 'BME280_ULTRAHIGHRES'.format(mode))
         self._mode = mode
+        self._osrs_t = mode if osrs_t is None else osrs_t
+        self._osrs_p = mode if osrs_p is None else osrs_p
+        self._osrs_h = mode if osrs_h is None else osrs_h
+        for osrs in (self._osrs_t, self._osrs_p, self._osrs_h):
+            if osrs not in [BME280_OSAMPLE_SKIP, BME280_OSAMPLE_1,
+                            BME280_OSAMPLE_2, BME280_OSAMPLE_4,
+                            BME280_OSAMPLE_8, BME280_OSAMPLE_16]:
+                raise ValueError(
+                    'Unexpected oversampling value {0}. Set it to one of '
+                    'BME280_OSAMPLE_*'.format(osrs))
+        if iir_filter not in [BME280_FILTER_OFF, BME280_FILTER_2,
+                              BME280_FILTER_4, BME280_FILTER_8,
+                              BME280_FILTER_16]:
+            raise ValueError(
+                'Unexpected filter value {0}. Set it to one of '
+                'BME280_FILTER_*'.format(iir_filter))
+        if not 0 <= standby < len(_STANDBY_US):
+            raise ValueError(
+                'Unexpected standby value {0}. Set it to one of '
+                'BME280_STANDBY_*'.format(standby))
+        self._standby = standby
+        self._normal_mode = normal_mode
         self.address = address
         if i2c is None:
             raise ValueError('An I2C object is required.')
@@ -78,7 +150,7 @@ class BME280:
             self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9, \
             _, self.dig_H1 = unpack("<HhhHhhhhhhhhBB", dig_88_a1)
 
-        self.dig_H2, self.dig_H3 = unpack("<hB", dig_e1_e7)
+        self.dig_H2, self.dig_H3 = unpack_from("<hB", dig_e1_e7)
         e4_sign = unpack_from("<b", dig_e1_e7, 3)[0]
         self.dig_H4 = (e4_sign << 4) | (dig_e1_e7[4] & 0xF)
 
@@ -87,8 +159,6 @@ class BME280:
 
         self.dig_H6 = unpack_from("<b", dig_e1_e7, 6)[0]
 
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
-                             bytearray([0x3F]))
         self.t_fine = 0
 
         # temporary data holders which stay allocated
@@ -96,8 +166,107 @@ class BME280:
         self._l8_barray = bytearray(8)
         self._l3_resultarray = array("i", [0, 0, 0])
 
+        # config register is written only in sleep mode, ctrl_hum takes
+        # effect with the following ctrl_meas write and then stays set
+        ctrl_meas = self._osrs_t << 5 | self._osrs_p << 2
+        self._forced = bytearray([ctrl_meas | BME280_FORCED_MODE])
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                             bytearray([ctrl_meas | BME280_SLEEP_MODE]))
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONFIG,
+                             bytearray([standby << 5 | iir_filter << 2]))
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
+                             bytearray([self._osrs_h]))
+        if normal_mode:
+            self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                                 bytearray([ctrl_meas | BME280_NORMAL_MODE]))
+        else:
+            self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                                 bytearray([ctrl_meas | BME280_SLEEP_MODE]))
+        self._measurement_start = time.ticks_us()
+
+    def measurement_time_us(self):
+        """ Maximum conversion time of one measurement for the configured
+            oversampling, datasheet appendix B. Skipped channels add
+            nothing.
+
+            Returns:
+                time in microseconds
+        """
+        t = 1250
+        if self._osrs_t:
+            t += 2300 * (1 << (self._osrs_t - 1))
+        if self._osrs_p:
+            t += 2300 * (1 << (self._osrs_p - 1)) + 575
+        if self._osrs_h:
+            t += 2300 * (1 << (self._osrs_h - 1)) + 575
+        return t
+
+    def sample_period_us(self):
+        """ Time between two results in normal mode, measurement time
+            plus standby time.
+        """
+        return self.measurement_time_us() + _STANDBY_US[self._standby]
+
+    def start_measurement(self):
+        """ Triggers one forced mode measurement and returns immediately.
+            Collect the result with read_measurement or collect once ready.
+            Does nothing in normal mode, the sensor measures on its own.
+        """
+        if self._normal_mode:
+            return
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                             self._forced)
+        self._measurement_start = time.ticks_us()
+
+    def is_measuring(self):
+        """ Reads the measuring bit of the status register. """
+        self.i2c.readfrom_mem_into(self.address, BME280_REGISTER_STATUS,
+                                   self._l1_barray)
+        return bool(self._l1_barray[0] & BME280_STATUS_MEASURING)
+
+    def ready(self, poll=False):
+        """ Checks whether the measurement started by start_measurement
+            has finished.
+
+            Args:
+                poll: ask the sensor status register instead of comparing
+                the elapsed time with the maximum conversion time. Usually
+                returns earlier, costs one I2C transaction per call
+            Returns:
+                True when the result can be read
+        """
+        if poll and not self._normal_mode:
+            return not self.is_measuring()
+        return self.remaining_us() == 0
+
+    def remaining_us(self):
+        """ Time left until the maximum conversion time has elapsed,
+            always 0 in normal mode where the last result is read.
+        """
+        if self._normal_mode:
+            return 0
+        elapsed = time.ticks_diff(time.ticks_us(), self._measurement_start)
+        remaining = self.measurement_time_us() - elapsed
+        return remaining if remaining > 0 else 0
+
+    def wait(self, poll=False):
+        """ Blocks until the started measurement has finished.
+
+            Args:
+                poll: poll the status register every 500 us instead of
+                sleeping for the whole maximum conversion time
+        """
+        if self._normal_mode:
+            return
+        if poll:
+            while self.is_measuring():
+                time.sleep_us(500)
+        else:
+            time.sleep_us(self.remaining_us())
+
     def read_raw_data(self, result):
         """ Reads the raw (uncompensated) data from the sensor.
+            In normal mode only the 8 byte burst read is done.
 
             Args:
                 result: array of length 3 or alike where the result will be
@@ -105,19 +274,76 @@ class BME280:
             Returns:
                 None
         """
+        self.start_measurement()
+        self.wait()
+        self.read_measurement(result)
 
-        self._l1_barray[0] = self._mode
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
-                             self._l1_barray)
-        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 1
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
-                             self._l1_barray)
+    def read_many(self, n, out, rate_hz=None, raw=False):
+        """ Reads n samples in a row into a caller supplied buffer. The loop
+            itself allocates no heap memory when raw is True; compensation
+            of pressure needs 64 bit intermediates which are heap integers
+            on MicroPython, use raw and compensate_many later to avoid them.
+
+            Args:
+                n: number of samples
+                out: array("i", 3 * n) or alike, filled with temperature,
+                pressure, humidity triples
+                rate_hz: sampling rate, None reads as fast as the sensor
+                allows. Use normal_mode with matching standby for rates
+                close to the conversion time
+                raw: store raw 20 bit values instead of compensated data
 
-        sleep_time = 1250 + 2300 * (1 << self._mode)
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        time.sleep_us(sleep_time)  # Wait the required time
+            Returns:
+                out
+        """
+        l3 = self._l3_resultarray
+        period = 1000000 // rate_hz if rate_hz else 0
+        next_us = time.ticks_us()
+        j = 0
+        for _ in range(n):
+            if period:
+                wait = time.ticks_diff(next_us, time.ticks_us())
+                if wait > 0:
+                    time.sleep_us(wait)
+                next_us = time.ticks_add(next_us, period)
+            self.read_raw_data(l3)
+            if not raw:
+                self.compensate(l3, l3)
+            out[j] = l3[0]
+            out[j + 1] = l3[1]
+            out[j + 2] = l3[2]
+            j += 3
+        return out
+
+    def compensate_many(self, data, n=None):
+        """ Compensates raw triples stored by read_many in place.
+
+            Args:
+                data: array("i") or alike with raw temperature, pressure,
+                humidity triples
+                n: number of triples, whole data if None
+        """
+        l3 = self._l3_resultarray
+        if n is None:
+            n = len(data) // 3
+        for j in range(0, 3 * n, 3):
+            l3[0] = data[j]
+            l3[1] = data[j + 1]
+            l3[2] = data[j + 2]
+            self.compensate(l3, l3)
+            data[j] = l3[0]
+            data[j + 1] = l3[1]
+            data[j + 2] = l3[2]
+        return data
 
+    def read_measurement(self, result):
+        """ Reads the raw data of the last finished measurement without
+            triggering a new one.
+
+            Args:
+                result: array of length 3 or alike where the result will be
+                stored, in temperature, pressure, humidity order
+        """
         # burst readout from 0xF7 to 0xFE, recommended by datasheet
         self.i2c.readfrom_mem_into(self.address, 0xF7, self._l8_barray)
         readout = self._l8_barray
@@ -145,7 +371,36 @@ class BME280:
                 the result parameter if not None
         """
         self.read_raw_data(self._l3_resultarray)
-        raw_temp, raw_press, raw_hum = self._l3_resultarray
+        return self.compensate(self._l3_resultarray, result)
+
+    def collect(self, result=None, poll=False):
+        """ Waits for the measurement started by start_measurement if it
+            is still running and returns the compensated data.
+
+            Args:
+                result: same as in read_compensated_data
+                poll: same as in wait
+
+            Returns:
+                array with temperature, pressure, humidity
+        """
+        self.wait(poll)
+        self.read_measurement(self._l3_resultarray)
+        return self.compensate(self._l3_resultarray, result)
+
+    def compensate(self, raw, result=None):
+        """ Converts raw data to compensated values using the calibration
+            data of this sensor.
+
+            Args:
+                raw: array of length 3 or alike with raw temperature,
+                pressure, humidity as stored by read_raw_data
+                result: same as in read_compensated_data
+
+            Returns:
+                array with temperature, pressure, humidity
+        """
+        raw_temp, raw_press, raw_hum = raw
         # temperature
         var1 = ((raw_temp >> 3) - (self.dig_T1 << 1)) * (self.dig_T2 >> 11)
         var2 = (((((raw_temp >> 4) - self.dig_T1) *
@@ -0,0 +1,134 @@
+# vectorized BME280 compensation for server side reprocessing of raw samples
+# integer path gives bit identical results to BME280.compensate in bme280.py,
+# float path implements the double precision formulas of the datasheet
+# requires numpy, not meant for the device
+
+import struct
+import numpy as np
+
+CALIBRATION_NAMES = ('dig_T1', 'dig_T2', 'dig_T3',
+                     'dig_P1', 'dig_P2', 'dig_P3', 'dig_P4', 'dig_P5',
+                     'dig_P6', 'dig_P7', 'dig_P8', 'dig_P9',
+                     'dig_H1', 'dig_H2', 'dig_H3', 'dig_H4', 'dig_H5', 'dig_H6')
+
+
+def parse_calibration(dig_88_a1, dig_e1_e7):
+    """
+    decodes calibration registers the same way as BME280.__init__
+    :param dig_88_a1: 26 bytes read from 0x88
+    :param dig_e1_e7: 7 bytes read from 0xE1
+    :return: dict of dig_* values
+    """
+    values = struct.unpack_from("<HhhHhhhhhhhhBB", dig_88_a1)
+    calib = dict(zip(CALIBRATION_NAMES[:12], values[:12]))
+    calib['dig_H1'] = values[13]
+    calib['dig_H2'], calib['dig_H3'] = struct.unpack_from("<hB", dig_e1_e7)
+    e4_sign = struct.unpack_from("<b", dig_e1_e7, 3)[0]
+    calib['dig_H4'] = (e4_sign << 4) | (dig_e1_e7[4] & 0xF)
+    e6_sign = struct.unpack_from("<b", dig_e1_e7, 5)[0]
+    calib['dig_H5'] = (e6_sign << 4) | (dig_e1_e7[4] >> 4)
+    calib['dig_H6'] = struct.unpack_from("<b", dig_e1_e7, 6)[0]
+    return calib
+
+
+def calibration(source):
+    """
+    :param source: dict of dig_* values or object with dig_* attributes, e.g. bme280.BME280
+    :return: dict of dig_* values
+    """
+    if isinstance(source, dict):
+        return {name: int(source[name]) for name in CALIBRATION_NAMES}
+    return {name: int(getattr(source, name)) for name in CALIBRATION_NAMES}
+
+
+def compensate(calib, raw_temp, raw_press, raw_hum):
+    """
+    integer compensation of raw samples, same arithmetic as BME280.compensate
+    int64 intermediates as in datasheet reference code, enough for real calibration values
+    :param calib: see calibration()
+    :param raw_temp, raw_press, raw_hum: array likes of raw 20 bit (16 bit humidity) values
+    :return: int64 arrays temperature (0.01 C), pressure (1/256 Pa), humidity (1/1024 %)
+    """
+    c = calibration(calib)
+    raw_temp = np.asarray(raw_temp, dtype=np.int64)
+    raw_press = np.asarray(raw_press, dtype=np.int64)
+    raw_hum = np.asarray(raw_hum, dtype=np.int64)
+
+    # temperature
+    var1 = ((raw_temp >> 3) - (c['dig_T1'] << 1)) * (c['dig_T2'] >> 11)
+    var2 = (((((raw_temp >> 4) - c['dig_T1']) *
+              ((raw_temp >> 4) - c['dig_T1'])) >> 12) * c['dig_T3']) >> 14
+    t_fine = var1 + var2
+    temp = (t_fine * 5 + 128) >> 8
+
+    # pressure
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * c['dig_P6']
+    var2 = var2 + ((var1 * c['dig_P5']) << 17)
+    var2 = var2 + (c['dig_P4'] << 35)
+    var1 = (((var1 * var1 * c['dig_P3']) >> 8) +
+            ((var1 * c['dig_P2']) << 12))
+    var1 = (((1 << 47) + var1) * c['dig_P1']) >> 33
+    zero = var1 == 0
+    p = 1048576 - raw_press
+    p = (((p << 31) - var2) * 3125) // np.where(zero, 1, var1)
+    var1 = (c['dig_P9'] * (p >> 13) * (p >> 13)) >> 25
+    var2 = (c['dig_P8'] * p) >> 19
+    pressure = ((p + var1 + var2) >> 8) + (c['dig_P7'] << 4)
+    pressure = np.where(zero, 0, pressure)
+
+    # humidity
+    h = t_fine - 76800
+    h = (((((raw_hum << 14) - (c['dig_H4'] << 20) -
+            (c['dig_H5'] * h)) + 16384)
+          >> 15) * (((((((h * c['dig_H6']) >> 10) *
+                        (((h * c['dig_H3']) >> 11) + 32768)) >> 10) +
+                      2097152) * c['dig_H2'] + 8192) >> 14))
+    h = h - (((((h >> 15) * (h >> 15)) >> 7) * c['dig_H1']) >> 4)
+    h = np.clip(h, 0, 419430400)
+    humidity = h >> 12
+
+    return temp, pressure, humidity
+
+
+def compensate_float(calib, raw_temp, raw_press, raw_hum):
+    """
+    double precision compensation from datasheet section 4.2.3
+    :param calib: see calibration()
+    :param raw_temp, raw_press, raw_hum: array likes of raw values
+    :return: float64 arrays temperature (C), pressure (Pa), humidity (%)
+    """
+    c = calibration(calib)
+    raw_temp = np.asarray(raw_temp, dtype=np.float64)
+    raw_press = np.asarray(raw_press, dtype=np.float64)
+    raw_hum = np.asarray(raw_hum, dtype=np.float64)
+
+    # temperature
+    var1 = (raw_temp / 16384.0 - c['dig_T1'] / 1024.0) * c['dig_T2']
+    var2 = (raw_temp / 131072.0 - c['dig_T1'] / 8192.0) ** 2 * c['dig_T3']
+    t_fine = var1 + var2
+    temp = t_fine / 5120.0
+
+    # pressure
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * c['dig_P6'] / 32768.0
+    var2 = var2 + var1 * c['dig_P5'] * 2.0
+    var2 = var2 / 4.0 + c['dig_P4'] * 65536.0
+    var1 = (c['dig_P3'] * var1 * var1 / 524288.0 + c['dig_P2'] * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * c['dig_P1']
+    zero = var1 == 0
+    p = 1048576.0 - raw_press
+    p = (p - var2 / 4096.0) * 6250.0 / np.where(zero, 1.0, var1)
+    var1 = c['dig_P9'] * p * p / 2147483648.0
+    var2 = p * c['dig_P8'] / 32768.0
+    pressure = np.where(zero, 0.0, p + (var1 + var2 + c['dig_P7']) / 16.0)
+
+    # humidity
+    h = t_fine - 76800.0
+    h = ((raw_hum - (c['dig_H4'] * 64.0 + c['dig_H5'] / 16384.0 * h)) *
+         (c['dig_H2'] / 65536.0 * (1.0 + c['dig_H6'] / 67108864.0 * h *
+                                   (1.0 + c['dig_H3'] / 67108864.0 * h))))
+    h = h * (1.0 - c['dig_H1'] * h / 524288.0)
+    humidity = np.clip(h, 0.0, 100.0)
+
+    return temp, pressure, humidity
@@ -4,10 +4,19 @@ import machine
 import uping
 import bme280
 import urequests
+import envpack
+import wifi_cache
+from sample_ring import SampleRing
+from scheduler import Scheduler
 from m_file import uini
 from machine import I2C, Pin, ADC
 import json
 
+# link states ending connection attempt early, names differ between firmware versions
+_LINK_FAILED = tuple(getattr(network, name) for name in (
+    'STAT_WRONG_PASSWORD', 'STAT_NO_AP_FOUND', 'STAT_CONNECT_FAIL',
+    'STAT_ASSOC_FAIL', 'STAT_HANDSHAKE_TIMEOUT', 'STAT_BEACON_TIMEOUT') if hasattr(network, name))
+
 
 class NetworkConnection:
     """
@@ -20,6 +29,7 @@ class NetworkConnection:
         self.sta_if.active(True)
         self.ini = uini()
         self.config_file = config_file
+        self.timings = {}
         self.load_config()
 
     def load_config(self):
@@ -67,9 +77,7 @@ class NetworkConnection:
         connects to AP
         improved preferred connect method
         """
-        self.sta_if.ifconfig((self.ipaddr, '255.255.255.0', self.gateway, self.gateway))
-        self.sta_if.connect(self.ssid, self.passwd)
-        utime.sleep(5)
+        self.associate()
         print('is connected? (sta_if): ', self.sta_if.isconnected())
         print('ifconfig: ', self.sta_if.ifconfig())
         check_conn = self.check_conn()
@@ -80,29 +88,157 @@ class NetworkConnection:
             psig.duty(0)
         return check_conn
 
-    def check_conn(self):
+    def associate(self, fast_timeout=1500, timeout=10000):
         """
-        checks network connection by pinging gateway
-        uses uping.py
+        connects to AP, access point of last connection kept in RTC memory is tried first,
+        full scan is done only when it is not known or does not answer
+        phase durations (ms) are kept in self.timings
+        :param fast_timeout: time for connection to cached access point, ms
+        :param timeout: time for connection after scan, ms
+        :return: True when link is up
         """
-        print('is connected? (sta_if): ', self.sta_if.isconnected())
-        try:
-            ping_status = uping.ping(self.gateway)
-            if ping_status == (4, 4):
-                conn_status = True
-                print('ping: connected')
+        self.timings = {}
+        start = utime.ticks_ms()
+        self.sta_if.ifconfig((self.ipaddr, '255.255.255.0', self.gateway, self.gateway))
+        cached = wifi_cache.load(self.ssid)
+        connected = False
+        if cached:
+            self._connect(*cached)
+            connected = self._wait(fast_timeout)
+            self.timings['cached'] = utime.ticks_diff(utime.ticks_ms(), start)
+            if not connected:
+                # stale entry would cost fast_timeout on every wakeup
+                wifi_cache.clear()
+        if not connected:
+            phase = utime.ticks_ms()
+            # scan is refused while connection attempt runs
+            self.sta_if.disconnect()
+            found = [ap for ap in self.sta_if.scan() if ap[0] == self.ssid.encode()]
+            self.timings['scan'] = utime.ticks_diff(utime.ticks_ms(), phase)
+            phase = utime.ticks_ms()
+            if found:
+                # strongest access point of ssid
+                best = max(found, key=lambda ap: ap[3])
+                self._connect(best[1], best[2])
             else:
-                conn_status = True
-                print('ping: some packets lost')
-        except OSError:
-            print('ping: not connected')
-            conn_status = False
+                self.sta_if.connect(self.ssid, self.passwd)
+            connected = self._wait(timeout)
+            self.timings['connect'] = utime.ticks_diff(utime.ticks_ms(), phase)
+            if connected:
+                self._remember(best[1] if found else None)
+        self.timings['total'] = utime.ticks_diff(utime.ticks_ms(), start)
+        print('wifi connected: ', connected, ', timings (ms): ', self.timings)
+        return connected
+
+    def _remember(self, bssid=None):
+        """
+        keeps access point of current connection in RTC memory
+        :param bssid: bssid of joined AP, None when unknown (plain connect), only channel is kept then
+        """
+        try:
+            channel = self.sta_if.config('channel')
+        except (ValueError, OSError):
+            return
+        wifi_cache.save(self.ssid, bssid, channel)
+
+    def _connect(self, bssid, channel):
+        """
+        starts connection to given access point
+        """
+        try:
+            # station stays on AP channel instead of probing all of them
+            self.sta_if.config(channel=channel)
+        except (ValueError, OSError):
+            pass
+        self.sta_if.connect(self.ssid, self.passwd, bssid=bssid)
+
+    def _wait(self, timeout):
+        """
+        polls link state until connected, failed or timeout (ms)
+        :return: True when connected
+        """
+        start = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), start) < timeout:
+            if self.sta_if.isconnected():
+                return True
+            if self.sta_if.status() in _LINK_FAILED:
+                return False
+            utime.sleep_ms(10)
+        return self.sta_if.isconnected()
+
+    async def connect_async(self, timeout=5000, fast_timeout=1500):
+        """
+        connects to AP without blocking other tasks
+        polls link state up to timeout (ms) instead of fixed sleep
+        access point cached by associate() is tried first, plain connect follows when it fails
+        or does not connect within fast_timeout (ms)
+        """
+        import uasyncio
+        self.sta_if.ifconfig((self.ipaddr, '255.255.255.0', self.gateway, self.gateway))
+        cached = wifi_cache.load(self.ssid)
+        if cached:
+            self._connect(*cached)
+        else:
+            self.sta_if.connect(self.ssid, self.passwd)
+        start = utime.ticks_ms()
+        while not self.sta_if.isconnected() and utime.ticks_diff(utime.ticks_ms(), start) < timeout:
+            if cached and (self.sta_if.status() in _LINK_FAILED or
+                           utime.ticks_diff(utime.ticks_ms(), start) > fast_timeout):
+                print('cached access point failed')
+                wifi_cache.clear()
+                cached = None
+                self.sta_if.disconnect()
+                self.sta_if.connect(self.ssid, self.passwd)
+            await uasyncio.sleep_ms(50)
+        if self.sta_if.isconnected() and not cached:
+            self._remember()
+        print('is connected? (sta_if): ', self.sta_if.isconnected(), ' after ', utime.ticks_diff(utime.ticks_ms(), start), ' ms')
+        check_conn = self.check_conn()
+        print('network connected: ', check_conn)
+        if check_conn:
+            psig.duty(10)
+        else:
+            psig.duty(0)
+        return check_conn
+
+    def check_conn(self, strategy=None, budget=None):
+        """
+        checks network connection with probe selected by config link_check
+        'ping': single echo to gateway, returns on first reply, uses uping.py
+        'tcp': connects to upload server (config probe_url), connection is kept in http session for upload
+        'none': link state only, failed upload is the only sign of missing connectivity
+        probe duration (ms) is kept in self.timings, round trip time of ping reply as 'rtt'
+        :param budget: time limit of probe, ms, default config link_budget_ms
+        :return: True when connected
+        """
+        if strategy is None:
+            strategy = config['link_check']
+        if budget is None:
+            budget = config['link_budget_ms']
+        start = utime.ticks_ms()
+        conn_status = self.sta_if.isconnected()
+        print('is connected? (sta_if): ', conn_status)
+        if conn_status and strategy == 'ping':
+            try:
+                result = uping.ping(self.gateway, count=1, timeout=budget, quiet=True)
+                conn_status = result[1] > 0
+                self.timings['rtt'] = result[3]
+            except OSError:
+                conn_status = False
+        elif conn_status and strategy == 'tcp':
+            try:
+                http.connect(config['probe_url'], timeout=budget / 1000)
+            except OSError:
+                conn_status = False
+        self.timings['probe'] = utime.ticks_diff(utime.ticks_ms(), start)
+        print('link check: ', strategy, ', connected: ', conn_status, ', cost: ', self.timings['probe'], ' ms')
         return conn_status
 
     def close(self):
         print('disconnecting network...')
         self.sta_if.disconnect()
-        print('network connected: ', self.check_conn())
+        # no probe, there is no link to check
+        print('network connected: ', self.sta_if.isconnected())
         psig.duty(0)
 
 
@@ -115,7 +251,23 @@ config = {
     'device_label': 'demo',
     'batt_divider': 1,
     'batt_correction': 1,
-    'batt_threshold': 3.2
+    'batt_threshold': 3.2,
+    'upload_every': 1,      # > 1 enables store and forward, samples per upload
+    'ring_capacity': 64,    # samples kept in RTC memory
+    'batch_url': 'http://192.168.0.14:5000/envdata-batch',
+    'payload_format': 'json',   # json or binary (envpack)
+    'async_upload': False,      # overlap network bring up, sensor read and uploads
+    'ubidots_upload': False,    # async mode also posts to ubidots
+    'link_check': 'ping',       # ping (single echo to gateway), tcp (connect to probe_url) or none
+    'link_budget_ms': 500,      # time limit of link check
+    'probe_url': 'http://192.168.0.14:5000/envdata',    # server of uploads, its connection is reused
+    'adaptive_schedule': True,  # report on change, deepsleep_period is shortest sleep; False: fixed period
+    'sleep_max': 600000,        # longest sleep while readings are stable, ms
+    'heartbeat': 3600,          # longest time without upload, s
+    'deadband_temperature': 0.2,    # C, smaller changes are not reported
+    'deadband_pressure': 0.5,       # hPa
+    'deadband_humidity': 1.0,       # %
+    'deadband_battery': 0.1         # V
 }
 config.update(uini().read("conf.json"))
 
@@ -123,15 +275,35 @@ pwm_freq = config['pwm_freq']
 psig = machine.PWM(machine.Pin(2), freq=pwm_freq)
 psig.duty(100)
 
+# keeps connection to upload server open between attempts and requests
+http = urequests.Session()
 
-def read_env_from_bme280():
+
+def start_env_measurement():
+    """
+    starts bme280 forced measurement and returns immediately
+    do other work, then pass returned sensor to read_env_from_bme280
+    """
     i2c = I2C(scl=Pin(5), sda=Pin(4), freq=400000)
     bme = bme280.BME280(i2c=i2c)
+    bme.start_measurement()
+    return bme
+
 
-    bme.read_compensated_data()
-    utime.sleep(1.5)
+def read_env_scaled_from_bme280(bme=None):
+    """
+    reads integer compensated values
+    waits only for the rest of the conversion time of measurement started by start_env_measurement
+    :param bme: sensor returned by start_env_measurement, new measurement is started if None
+    :return: temperature (0.01 C), pressure (1/256 Pa), humidity (1/1024 %)
+    """
+    if bme is None:
+        bme = start_env_measurement()
+    return bme.collect()
 
-    t, p, h = bme.read_compensated_data()
+
+def read_env_from_bme280(bme=None):
+    t, p, h = read_env_scaled_from_bme280(bme)
 
     t = t / 100
     p = p / 25600
@@ -141,6 +313,18 @@ def read_env_from_bme280():
     return data
 
 
+async def read_env_from_bme280_async():
+    """
+    same as read_env_from_bme280, other tasks run while waiting for sensor
+    """
+    import uasyncio
+    bme = start_env_measurement()
+    await uasyncio.sleep_ms(bme.remaining_us() // 1000 + 1)
+
+    t, p, h = bme.collect()
+    return t / 100, p / 25600, h / 1024
+
+
 def read_battery_level(divider, correction):
     """
     reads battery voltage (V)
@@ -161,7 +345,10 @@ def read_battery_level(divider, correction):
     return raw_adc_value, voltage, voltage_corrected
 
 
-def write_data_to_ubidots(data):
+def write_data_to_ubidots(data, url=None, content_type="application/json", stamp=False):
+    """
+    :param stamp: send device clock with every attempt, server rebases record timestamps with it
+    """
     token = config['token']  # Put your TOKEN here
     device_label = config['device_label']  # Put your device label here
     """
@@ -171,8 +358,9 @@ def write_data_to_ubidots(data):
     """
 
     # url = "http://things.ubidots.com/api/v1.6/devices/{}".format(device_label)
-    url = "http://192.168.0.14:5000/envdata"
-    headers = {"X-Auth-Token": token, "Content-Type": "application/json"}
+    if url is None:
+        url = "http://192.168.0.14:5000/envdata"
+    headers = {"X-Auth-Token": token, "Content-Type": content_type}
     """
     payload = {
         temperature: data[0],
@@ -186,9 +374,16 @@ def write_data_to_ubidots(data):
     status = 400
     attempts = 0
     while status >= 400 and attempts <= 5:
-        req = urequests.post(url=url, headers=headers, json=payload)
+        if stamp:
+            headers[envpack.DEVICE_TIME_HEADER] = str(utime.time())
+        if isinstance(payload, str):
+            req = http.post(url=url, headers=headers, json=payload)
+        else:
+            # callable payload builds new streamed body for every attempt
+            req = http.post(url=url, headers=headers, data=payload() if callable(payload) else payload)
         status = req.status_code
         attempts += 1
+        req.content  # read body, connection returns to session
         req.close()
         utime.sleep(1)
 
@@ -202,16 +397,109 @@ def write_data_to_ubidots(data):
     return True
 
 
-def main():
+def json_chunks(ring):
+    """
+    yields json list of all samples stored in ring, one sample at a time
+    """
+    separator = b'['
+    for record in ring.records():
+        yield separator
+        yield json.dumps(envpack.to_dict(record))
+        separator = b','
+    yield b']' if separator == b',' else b'[]'
+
+
+async def post_with_retry(url, headers, attempts=6, **kw):
+    """
+    posts until server accepts request, waits 1 s between attempts without blocking
+    :return: True on success
+    """
+    import uasyncio
+    import urequests_async
+    status = 400
+    attempt = 0
+    while status >= 400 and attempt < attempts:
+        if attempt:
+            await uasyncio.sleep(1)
+        attempt += 1
+        try:
+            req = await urequests_async.post(url, headers=headers, timeout=10, **kw)
+            status = req.status_code
+            await req.content()
+        except (OSError, ValueError, NotImplementedError, uasyncio.TimeoutError) as e:
+            print('upload error: ', url, e)
+
+    if status >= 400:
+        print('[ERROR] Could not send data to ', url)
+        return False
+    print('[INFO] request made properly: ', url)
+    return True
+
+
+async def main_async():
+    """
+    asynchronous variant of main
+    network bring up overlaps sensor conversion, uploads to all endpoints run concurrently
+    uasyncio and urequests_async are imported only in this mode, fixed mode wakeups skip them
+    """
+    import uasyncio
     battery = read_battery_level(config['batt_divider'], config['batt_correction'])
     print('battery voltage: ', battery)
     if battery[1] < config['batt_threshold']:
         print('!! BATTERY LEVEL LOW !!')
 
     net = NetworkConnection('conf.json')
-    net_status = net.connect2()
+    net_task = uasyncio.create_task(net.connect_async())
+    env = await read_env_from_bme280_async()
+    print('env: ', env)
+    await net_task
+
+    payload = {
+        'temperature': env[0],
+        'pressure': env[1],
+        'humidity': env[2],
+        'battery': battery[1]
+    }
+    uploads = [post_with_retry("http://192.168.0.14:5000/envdata", {"X-Auth-Token": config['token']},
+                               json=json.dumps(payload))]
+    if config['ubidots_upload']:
+        url = "http://things.ubidots.com/api/v1.6/devices/{}".format(config['device_label'])
+        uploads.append(post_with_retry(url, {"X-Auth-Token": config['token']}, json=payload))
+    results = await uasyncio.gather(*uploads)
+    if not all(results):
+        psig.duty(25)
+
+    net.close()
+    deep_sleep(battery)
 
-    env = read_env_from_bme280()
+
+def batch_payload(ring):
+    """
+    builds payload with all samples stored in ring
+    payload is function returning generator, body is streamed and never built whole in RAM
+    :return: payload, content type
+    """
+    if config['payload_format'] == 'binary':
+        return ring.chunks, envpack.CONTENT_TYPE
+    return lambda: json_chunks(ring), "application/json"
+
+
+def single_payload(battery, env):
+    """
+    builds payload with single sample
+    binary format packs scaled integers directly, no floats or dict are created
+    :param env: scaled readings from read_env_scaled_from_bme280
+    :return: payload, content type
+    """
+    if config['payload_format'] == 'binary':
+        t, p, h = env
+        print('env: ', t, p, h)
+        buf = bytearray(envpack.payload_size(1))
+        envpack.pack_header(buf, 1)
+        envpack.pack_record(buf, 0, utime.time(), t, p, h, int(battery[1] * 1000))
+        return buf, envpack.CONTENT_TYPE
+
+    env = (env[0] / 100, env[1] / 25600, env[2] / 1024)
     print('env: ', env)
 
     payload = {
@@ -220,8 +508,96 @@ def main():
         'humidity': env[2],
         'battery': battery[1]
     }
+    return json.dumps(payload), "application/json"
+
+
+def store_and_forward(battery, env, force=False):
+    """
+    stores sample in RTC memory ring
+    network is brought up only every config['upload_every'] samples or when ring is nearly full,
+    whole backlog is then sent in single request
+    records are stamped with device clock, which is not synced, upload carries current device clock
+    in envpack.DEVICE_TIME_HEADER so server can place records in time
+    :param env: scaled readings from read_env_scaled_from_bme280
+    :param force: upload backlog now
+    :return: True when backlog was uploaded
+    """
+    t, p, h = env
+    ring = SampleRing(config['ring_capacity'])
+    ring.append(utime.time(), t, p, h, int(battery[1] * 1000))
+
+    pending = ring.pending()
+    print('samples pending: ', pending)
+    if pending < config['upload_every'] and not ring.nearly_full() and not force:
+        return False
+
+    uploaded = False
+    net = NetworkConnection('conf.json')
+    if net.connect2():
+        try:
+            payload, content_type = batch_payload(ring)
+            if write_data_to_ubidots(payload, url=config['batch_url'], content_type=content_type, stamp=True):
+                ring.clear()
+                uploaded = True
+        except (ValueError, NotImplementedError):
+            print('urequests error')
+            psig.duty(100)
+        except (IndexError, OSError):
+            print('socket error')
+            psig.duty(25)
+    http.close()
+    net.close()
+    return uploaded
+
+
+def create_scheduler():
+    """
+    scheduler with deadbands from config scaled to sensor readings
+    """
+    deadbands = (int(config['deadband_temperature'] * 100), int(config['deadband_pressure'] * 25600),
+                 int(config['deadband_humidity'] * 1024), int(config['deadband_battery'] * 1000))
+    return Scheduler(config['deepsleep_period'], config['sleep_max'], config['heartbeat'], deadbands)
+
+
+def main():
+    if config['async_upload']:
+        import uasyncio
+        uasyncio.run(main_async())
+        return
+
+    # sensor converts while battery is read
+    bme = start_env_measurement()
+    battery = read_battery_level(config['batt_divider'], config['batt_correction'])
+    print('battery voltage: ', battery)
+    if battery[1] < config['batt_threshold']:
+        print('!! BATTERY LEVEL LOW !!')
+
+    env = read_env_scaled_from_bme280(bme)
+    schedule = None
+    if config['adaptive_schedule']:
+        schedule = create_scheduler()
+        readings = env + (int(battery[1] * 1000),)
+        if not schedule.sample(utime.time(), readings):
+            print('readings within deadbands, radio stays off')
+            deep_sleep(battery, schedule.period)
+            return
+
+    if config['upload_every'] > 1:
+        uploaded = store_and_forward(battery, env, force=schedule is not None and schedule.heartbeat_due)
+        if schedule:
+            # queued sample is reported, heartbeat counts from upload
+            schedule.stored(readings, utime.time() if uploaded else None)
+        deep_sleep(battery, schedule and schedule.period)
+        return
+
+    net = NetworkConnection('conf.json')
+    net_status = net.connect2()
+
+    uploaded = False
+    payload, content_type = single_payload(battery, env)
     try:
-        write_data_to_ubidots(json.dumps(payload))
+        uploaded = write_data_to_ubidots(payload, content_type=content_type,
+                                         stamp=content_type == envpack.CONTENT_TYPE)
     except (ValueError, NotImplementedError):
         print('urequests error')
         psig.duty(100)
@@ -229,12 +605,24 @@ def main():
         print('socket error')
         psig.duty(25)
 
+    http.close()
     net.close()
 
+    if schedule:
+        # failed upload is repeated on next wakeup, readings stay outside deadband
+        if uploaded:
+            schedule.stored(readings, utime.time())
+    deep_sleep(battery, schedule and schedule.period)
+
+
+def deep_sleep(battery, period=None):
+    """
+    :param period: sleep time, ms, default config deepsleep_period
+    """
     if battery[1] < config['batt_threshold']:
         machine.deepsleep(config['deepsleep_period'] * 300)
     else:
-        machine.deepsleep(config['deepsleep_period'])
+        machine.deepsleep(period or config['deepsleep_period'])
 
 
 def test_batt():
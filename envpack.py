@@ -0,0 +1,99 @@
+# compact binary wire format for environment samples
+# payload: header followed by count fixed width little endian records
+# runs on MicroPython (encoding on device) and CPython (decoding on server)
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+CONTENT_TYPE = 'application/x-envmon'
+VERSION = 1
+# device clock (s) at time of sending, record timestamps are on the same clock,
+# which is not synced, server rebases them with rebase()
+DEVICE_TIME_HEADER = 'X-Device-Time'
+
+# magic, version, flags (reserved), record count
+HEADER_FORMAT = '<2sBBH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'EM'
+
+# timestamp (s), temperature (0.01 C), pressure (1/256 Pa), humidity (1/1024 %), battery (mV)
+# integer values as returned by BME280.read_compensated_data
+RECORD_FORMAT = '<IiIIH'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+
+def payload_size(count):
+    return HEADER_SIZE + count * RECORD_SIZE
+
+
+def pack_header(buf, count):
+    """
+    writes header for count records to start of buf
+    """
+    struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, VERSION, 0, count)
+
+
+def pack_record(buf, index, timestamp, temperature, pressure, humidity, battery):
+    """
+    writes record number index into payload buffer buf
+    """
+    struct.pack_into(RECORD_FORMAT, buf, HEADER_SIZE + index * RECORD_SIZE,
+                     timestamp, temperature, pressure, humidity, battery)
+
+
+def encode(records):
+    """
+    builds payload from sequence of records
+    :param records: sequence of (timestamp, temperature, pressure, humidity, battery)
+    :return: bytearray
+    """
+    buf = bytearray(payload_size(len(records)))
+    pack_header(buf, len(records))
+    for i, record in enumerate(records):
+        pack_record(buf, i, *record)
+    return buf
+
+
+def decode(data):
+    """
+    parses payload
+    :param data: bytes like payload
+    :return: list of (timestamp, temperature, pressure, humidity, battery) tuples
+    """
+    if len(data) < HEADER_SIZE:
+        raise ValueError('payload too short')
+    magic, version, _, count = struct.unpack_from(HEADER_FORMAT, data, 0)
+    if magic != MAGIC:
+        raise ValueError('not an envmon payload')
+    if version != VERSION:
+        raise ValueError('unsupported payload version {}'.format(version))
+    if len(data) != payload_size(count):
+        raise ValueError('payload length {} does not match {} records'.format(len(data), count))
+    return [struct.unpack_from(RECORD_FORMAT, data, HEADER_SIZE + i * RECORD_SIZE) for i in range(count)]
+
+
+def to_dict(record):
+    """
+    converts record to the dict sent by the json path
+    """
+    timestamp, t, p, h, battery = record
+    return {
+        'timestamp': timestamp,
+        'temperature': t / 100,
+        'pressure': p / 25600,
+        'humidity': h / 1024,
+        'battery': battery / 1000
+    }
+
+
+def rebase(records, device_time, received_at):
+    """
+    moves record timestamps from unsynced device clock to server clock
+    :param device_time: value of DEVICE_TIME_HEADER
+    :param received_at: server time of request (s)
+    :return: list of records with timestamps in server clock
+    """
+    offset = received_at - device_time
+    return [(record[0] + offset,) + tuple(record[1:]) for record in records]
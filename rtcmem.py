@@ -0,0 +1,53 @@
+# RTC memory helpers for esp32
+# RTC slow memory survives deep sleep, it is cleared on power on and hard reset
+# all users share one blob, each one owns its own region given below
+
+import machine
+
+# esp32 port keeps up to 2048 bytes of user data
+SIZE = 2048
+
+# regions are allocated from the end, ring takes the rest
+
+# wifi_cache, access point of last connection
+WIFI_SIZE = 16
+WIFI_OFFSET = SIZE - WIFI_SIZE
+
+# scheduler.Scheduler, last and reported readings, wakeup period
+SCHEDULE_SIZE = 48
+SCHEDULE_OFFSET = WIFI_OFFSET - SCHEDULE_SIZE
+
+# sample_ring.SampleRing
+RING_OFFSET = 0
+RING_END = SCHEDULE_OFFSET
+
+_rtc = machine.RTC()
+
+
+def read(offset, size):
+    """
+    reads region of RTC memory
+    bytes never written read as zero
+    :param offset: region start
+    :param size: region length
+    :return: bytearray of region length
+    """
+    data = bytearray(size)
+    chunk = _rtc.memory()[offset:offset + size]
+    data[:len(chunk)] = chunk
+    return data
+
+
+def write(offset, data):
+    """
+    writes region of RTC memory
+    keeps the rest of RTC memory untouched
+    :param offset: region start
+    :param data: bytes, bytearray or memoryview to store
+    """
+    blob = bytearray(_rtc.memory())
+    end = offset + len(data)
+    if len(blob) < end:
+        blob.extend(bytes(end - len(blob)))
+    blob[offset:end] = data
+    _rtc.memory(blob)
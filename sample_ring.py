@@ -0,0 +1,123 @@
+# store of environment samples waiting for upload
+# records are kept in RTC memory across deep sleep, flash file is used as overflow
+
+import uos
+import ustruct
+import rtcmem
+import envpack
+from envpack import RECORD_FORMAT, RECORD_SIZE
+
+_MAGIC = 0x5352
+_HEADER_FORMAT = '<HHH'  # magic, capacity, count
+_HEADER_SIZE = ustruct.calcsize(_HEADER_FORMAT)
+
+
+class SampleRing:
+    """
+    fixed size store of sample records in RTC memory
+    when RTC memory is full, records are moved to overflow file on flash,
+    overflow file keeps at most overflow_limit newest records
+    """
+    def __init__(self, capacity=64, overflow_file='samples.bin', overflow_limit=512):
+        if rtcmem.RING_OFFSET + _HEADER_SIZE + capacity * RECORD_SIZE > rtcmem.RING_END:
+            raise ValueError('ring capacity {} does not fit into RTC memory'.format(capacity))
+        self.capacity = capacity
+        self.overflow_file = overflow_file
+        self.overflow_limit = overflow_limit
+        self.buf = rtcmem.read(rtcmem.RING_OFFSET, _HEADER_SIZE + capacity * RECORD_SIZE)
+        magic, stored_capacity, count = ustruct.unpack_from(_HEADER_FORMAT, self.buf, 0)
+        if magic != _MAGIC or stored_capacity != capacity or count > capacity:
+            # power on or changed layout, start empty
+            count = 0
+        self.count = count
+
+    def _save(self):
+        ustruct.pack_into(_HEADER_FORMAT, self.buf, 0, _MAGIC, self.capacity, self.count)
+        rtcmem.write(rtcmem.RING_OFFSET, memoryview(self.buf)[:_HEADER_SIZE + self.count * RECORD_SIZE])
+
+    def append(self, timestamp, temperature, pressure, humidity, battery):
+        """
+        stores one sample, moves stored records to flash first if RTC memory is full
+        """
+        if self.count == self.capacity:
+            self._spill()
+        ustruct.pack_into(RECORD_FORMAT, self.buf, _HEADER_SIZE + self.count * RECORD_SIZE,
+                          timestamp, temperature, pressure, humidity, battery)
+        self.count += 1
+        self._save()
+
+    def _spill(self):
+        with open(self.overflow_file, 'ab') as f:
+            f.write(memoryview(self.buf)[_HEADER_SIZE:_HEADER_SIZE + self.count * RECORD_SIZE])
+        self.count = 0
+        excess = self.overflow_count() - self.overflow_limit
+        if excess > 0:
+            with open(self.overflow_file, 'rb') as f:
+                f.seek(excess * RECORD_SIZE)
+                data = f.read()
+            with open(self.overflow_file, 'wb') as f:
+                f.write(data)
+
+    def overflow_count(self):
+        try:
+            return uos.stat(self.overflow_file)[6] // RECORD_SIZE
+        except OSError:
+            return 0
+
+    def pending(self):
+        """
+        number of stored records, RTC memory and flash
+        """
+        return self.overflow_count() + self.count
+
+    def nearly_full(self, margin=2):
+        """
+        True when RTC memory is about to overflow to flash
+        """
+        return self.count >= self.capacity - margin
+
+    def records(self):
+        """
+        yields stored records oldest first as tuples in RECORD_FORMAT order
+        """
+        record = bytearray(RECORD_SIZE)
+        try:
+            with open(self.overflow_file, 'rb') as f:
+                while f.readinto(record) == RECORD_SIZE:
+                    yield ustruct.unpack(RECORD_FORMAT, record)
+        except OSError:
+            pass
+        for i in range(self.count):
+            yield ustruct.unpack_from(RECORD_FORMAT, self.buf, _HEADER_SIZE + i * RECORD_SIZE)
+
+    def chunks(self, size=256):
+        """
+        yields envpack payload with all stored records in parts
+        for streamed upload, payload is never built whole in memory
+        yielded buffers are reused, they are valid until next part is requested
+        """
+        header = bytearray(envpack.HEADER_SIZE)
+        envpack.pack_header(header, self.pending())
+        yield header
+        buf = bytearray(size - size % RECORD_SIZE)
+        try:
+            with open(self.overflow_file, 'rb') as f:
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    yield memoryview(buf)[:n]
+        except OSError:
+            pass
+        yield memoryview(self.buf)[_HEADER_SIZE:_HEADER_SIZE + self.count * RECORD_SIZE]
+
+    def clear(self):
+        """
+        drops all stored records, call after successful upload
+        """
+        try:
+            uos.remove(self.overflow_file)
+        except OSError:
+            pass
+        self.count = 0
+        self._save()
@@ -0,0 +1,84 @@
+# adaptive wakeup period and report on change, state is kept in RTC memory across deep sleep
+# readings are compared with last reported ones, radio stays off while all of them are inside deadbands
+# and heartbeat is not due; period is shortened when readings move and stretched while they are stable
+
+import ustruct
+import rtcmem
+
+_MAGIC = 0x5343
+# magic, last and reported readings (temperature, pressure, humidity, battery), last sample time,
+# last upload time, period
+_FORMAT = '<HiIIHiIIHIII'
+_SIZE = ustruct.calcsize(_FORMAT)
+
+
+class Scheduler:
+    """
+    decides whether sample is reported and how long to sleep
+    readings are scaled integers: temperature (0.01 C), pressure (1/256 Pa), humidity (1/1024 %), battery (mV)
+    :param min_period: shortest sleep, used while readings change, ms
+    :param max_period: longest sleep while readings are stable, ms
+    :param heartbeat: longest time without upload, s
+    :param deadbands: changes of readings smaller than these are not reported, same units as readings
+    """
+    def __init__(self, min_period, max_period, heartbeat, deadbands):
+        if rtcmem.SCHEDULE_SIZE < _SIZE:
+            raise ValueError('scheduler state does not fit into RTC memory')
+        self.min_period = min_period
+        self.max_period = max(max_period, min_period)
+        self.heartbeat = heartbeat
+        self.deadbands = deadbands
+        state = ustruct.unpack_from(_FORMAT, rtcmem.read(rtcmem.SCHEDULE_OFFSET, _SIZE), 0)
+        # power on, start with report and shortest period
+        self.valid = state[0] == _MAGIC
+        self.last = state[1:5]
+        self.reported = state[5:9]
+        self.sampled_at, self.uploaded_at, self.period = state[9:12]
+        if not self.valid:
+            self.period = min_period
+        self.heartbeat_due = True
+
+    def _save(self):
+        rtcmem.write(rtcmem.SCHEDULE_OFFSET, ustruct.pack(
+            _FORMAT, _MAGIC, *(self.last + self.reported + (self.sampled_at, self.uploaded_at, self.period))))
+
+    def sample(self, now, readings):
+        """
+        takes new readings and picks next period
+        while stable, period is doubled up to max_period, but not beyond time when trend of readings
+        is expected to leave deadband
+        :param now: time of sample, s (utime.time)
+        :param readings: temperature, pressure, humidity, battery
+        :return: True when sample should be reported
+        """
+        elapsed = now - self.sampled_at
+        # clock set back, state can not be trusted
+        valid = self.valid and elapsed > 0 and now >= self.uploaded_at
+        self.heartbeat_due = not valid or now - self.uploaded_at >= self.heartbeat
+        changed = not valid
+        period = self.period * 2
+        for value, last, reported, deadband in zip(readings, self.last, self.reported, self.deadbands):
+            distance = abs(value - reported)
+            if distance >= deadband:
+                changed = True
+            elif valid and value != last:
+                # ms until linear trend crosses deadband
+                period = min(period, (deadband - distance) * elapsed * 1000 // abs(value - last))
+        self.period = self.min_period if changed else min(max(period, self.min_period), self.max_period)
+        self.last = tuple(readings)
+        self.sampled_at = now
+        self.valid = True
+        self._save()
+        print('schedule: changed: ', changed, ', heartbeat: ', self.heartbeat_due, ', period: ', self.period, ' ms')
+        return changed or self.heartbeat_due
+
+    def stored(self, readings, now=None):
+        """
+        readings were sent or queued for upload, further changes are measured from them
+        :param now: time of successful upload, s, None when sample was only queued
+        """
+        self.reported = tuple(readings)
+        if now is not None:
+            self.uploaded_at = now
+            self.heartbeat_due = False
+        self._save()
@@ -0,0 +1,93 @@
+# benchmark of BME280.read_many against mocked I2C bus
+# reports samples per second and garbage collector activity
+# runs on unix port of MicroPython or CPython: python tests/bme280_bench.py
+import sys
+import gc
+import time
+from array import array
+
+sys.path.insert(0, '.')
+if not hasattr(time, 'ticks_us'):
+    # CPython, provide the MicroPython time functions used by the driver
+    time.ticks_us = lambda: int(time.perf_counter() * 1000000)
+    time.ticks_diff = lambda a, b: a - b
+    time.ticks_add = lambda a, b: a + b
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+try:
+    from ustruct import pack
+except ImportError:
+    from struct import pack
+
+import bme280
+
+# calibration of a real sensor
+CALIBRATION_88 = pack("<HhhHhhhhhhhhBB", 28122, 26462, 50, 37696, -10578, 3024,
+                      8006, -150, -7, 9900, -10230, 4285, 0, 75)
+CALIBRATION_E1 = bytes([0x6B, 0x01, 0x00, 0x13, 0x2A, 0x03, 0x1E])
+# pressure 0x5AFC0, temperature 0x81F30, humidity 0x6A5E
+READOUT = bytes([0x5A, 0xFC, 0x00, 0x81, 0xF3, 0x00, 0x6A, 0x5E])
+
+
+class FakeI2C:
+    transactions = 0
+
+    def readfrom_mem(self, addr, reg, n):
+        FakeI2C.transactions += 1
+        return CALIBRATION_88 if reg == 0x88 else CALIBRATION_E1
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        FakeI2C.transactions += 1
+        if reg == 0xF7:
+            buf[:] = READOUT
+        else:
+            buf[0] = 0
+
+    def writeto_mem(self, addr, reg, buf):
+        FakeI2C.transactions += 1
+
+
+def gc_activity(fn):
+    """
+    MicroPython: bytes allocated while gc is disabled, no allocation means no collection
+    CPython: number of collections
+    """
+    if hasattr(gc, 'mem_alloc'):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        fn()
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return '{} bytes allocated'.format(used)
+    before = sum(stat['collections'] for stat in gc.get_stats())
+    fn()
+    return '{} gc collections'.format(sum(stat['collections'] for stat in gc.get_stats()) - before)
+
+
+def run(name, sensor, n, **kw):
+    out = array("i", [0] * (3 * n))
+    sensor.read_many(10, out, **kw)  # warm up
+    FakeI2C.transactions = 0
+    start = time.ticks_us()
+    sensor.read_many(n, out, **kw)
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    transactions = FakeI2C.transactions / n
+    activity = gc_activity(lambda: sensor.read_many(n, out, **kw))
+    print('{:24} {:9.0f} samples/s {:4.1f} I2C/sample  {}'.format(
+        name, n * 1000000 / elapsed, transactions, activity))
+    return out
+
+
+forced = bme280.BME280(i2c=FakeI2C())
+normal = bme280.BME280(i2c=FakeI2C(), normal_mode=True)
+print('compensated sample: ', list(forced.read_compensated_data()))
+run('forced, compensated', forced, 50)
+run('normal, compensated', normal, 2000)
+raw = run('normal, raw', normal, 2000, raw=True)
+run('normal, raw, 50 Hz', normal, 50, raw=True, rate_hz=50)
+
+start = time.ticks_us()
+normal.compensate_many(raw)
+elapsed = time.ticks_diff(time.ticks_us(), start)
+print('{:24} {:9.0f} samples/s'.format('compensate_many', 2000 * 1000000 / elapsed))
@@ -0,0 +1,95 @@
+# parity check of bme280_numpy.compensate against BME280.compensate and throughput benchmark
+# runs on CPython with numpy: python tests/bme280_numpy_parity.py
+import sys
+import time
+from array import array
+from struct import pack
+
+import numpy as np
+
+sys.path.insert(0, '.')
+if not hasattr(time, 'ticks_us'):
+    # driver init uses MicroPython time functions
+    time.ticks_us = lambda: int(time.perf_counter() * 1000000)
+
+import bme280
+import bme280_numpy
+
+# calibration of real sensors
+# int64 intermediates follow the datasheet reference code, they hold for real
+# calibration values but not for arbitrary ones (python integers never overflow)
+CALIBRATIONS = [
+    (pack("<HhhHhhhhhhhhBB", 28122, 26462, 50, 37696, -10578, 3024,
+          8006, -150, -7, 9900, -10230, 4285, 0, 75),
+     bytes([0x6B, 0x01, 0x00, 0x13, 0x2A, 0x03, 0x1E])),
+    (pack("<HhhHhhhhhhhhBB", 27504, 26435, -1000, 36477, -10685, 3024,
+          2855, 140, -7, 15500, -14600, 6000, 0, 75),
+     bytes([0x6A, 0x01, 0x00, 0x13, 0x2C, 0x03, 0x1E])),
+]
+
+
+class FakeI2C:
+
+    def __init__(self, calibration):
+        self.calibration = calibration
+
+    def readfrom_mem(self, addr, reg, n):
+        return self.calibration[0] if reg == 0x88 else self.calibration[1]
+
+    def writeto_mem(self, addr, reg, buf):
+        pass
+
+
+def check_parity(sensor, raw_temp, raw_press, raw_hum):
+    temp, press, hum = bme280_numpy.compensate(sensor, raw_temp, raw_press, raw_hum)
+    raw = array("i", [0, 0, 0])
+    result = array("i", [0, 0, 0])
+    for i in range(len(raw_temp)):
+        raw[0], raw[1], raw[2] = int(raw_temp[i]), int(raw_press[i]), int(raw_hum[i])
+        expected = sensor.compensate(raw, result)
+        got = (int(temp[i]), int(press[i]), int(hum[i]))
+        assert tuple(expected) == got, (tuple(raw), tuple(expected), got)
+
+
+rng = np.random.default_rng(1)
+for n, calibration in enumerate(CALIBRATIONS):
+    sensor = bme280.BME280(i2c=FakeI2C(calibration))
+    assert bme280_numpy.calibration(sensor) == bme280_numpy.parse_calibration(*calibration)
+    # full 20 bit and 16 bit ranges plus boundaries
+    raw_temp = np.concatenate([rng.integers(0, 1 << 20, 20000), [0, 0x80000, (1 << 20) - 1]])
+    raw_press = np.concatenate([rng.integers(0, 1 << 20, 20000), [0, 0x80000, (1 << 20) - 1]])
+    raw_hum = np.concatenate([rng.integers(0, 1 << 16, 20000), [0, 0x8000, (1 << 16) - 1]])
+    check_parity(sensor, raw_temp, raw_press, raw_hum)
+    print('calibration {}: integer compensation identical for {} samples'.format(n, len(raw_temp)))
+
+    temp, press, hum = bme280_numpy.compensate(sensor, raw_temp, raw_press, raw_hum)
+    # driver temperature formula shifts dig_T2 before multiplying, datasheet shifts the product,
+    # differences to the float formulas come mostly from that through t_fine
+    ftemp, fpress, fhum = bme280_numpy.compensate_float(sensor, raw_temp, raw_press, raw_hum)
+    print('    float formulas, max difference in plausible range: {:.3f} C, {:.2f} Pa, {:.3f} %'.format(
+        np.abs(ftemp - temp / 100)[(temp > -4000) & (temp < 8500)].max(),
+        np.abs(fpress - press / 256)[(press > 30000 * 256) & (press < 110000 * 256)].max(),
+        np.abs(fhum - hum / 1024)[(hum > 0) & (hum < 100 * 1024)].max()))
+
+# throughput
+sensor = bme280.BME280(i2c=FakeI2C(CALIBRATIONS[0]))
+n = 1000000
+raw_temp = rng.integers(480000, 560000, n)
+raw_press = rng.integers(300000, 400000, n)
+raw_hum = rng.integers(20000, 40000, n)
+
+start = time.perf_counter()
+bme280_numpy.compensate(sensor, raw_temp, raw_press, raw_hum)
+vectorized = time.perf_counter() - start
+
+raw = array("i", [0, 0, 0])
+result = array("i", [0, 0, 0])
+m = 100000
+start = time.perf_counter()
+for i in range(m):
+    raw[0], raw[1], raw[2] = raw_temp[i], raw_press[i], raw_hum[i]
+    sensor.compensate(raw, result)
+scalar = (time.perf_counter() - start) * n / m
+
+print('{} samples: vectorized {:.3f} s ({:.1f} M samples/s), scalar {:.1f} s, {:.0f}x'.format(
+    n, vectorized, n / vectorized / 1e6, scalar, scalar / vectorized))
@@ -0,0 +1,66 @@
+# push delivery of visualizer/humidity/push.py and conditional requests of client.py against sse_standin.py
+# subscribers must get every streamed sample in order, also after stream was idle longer than read timeout, /envdata-last must answer 204 for since
+# not older than newest sample and 304 for ETag of newest sample, client.get returns None for both
+# python tests/push_standin.py
+import sys
+import json
+import time
+import threading
+
+sys.path.insert(0, 'visualizer/humidity')
+import client
+import push
+import sse_standin
+
+push.TIMEOUT = (5, 1)
+server = sse_standin.serve(port=0, interval=0.1)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+# push, two sessions share one upstream connection
+events = [[], []]
+received = threading.Event()
+
+
+def on_event(index):
+    def callback(row):
+        events[index].append(row)
+        if len(events[0]) >= 5:
+            received.set()
+    return callback
+
+
+unsubscribe = [push.subscribe(url + '/envdata-stream', on_event(i)) for i in range(2)]
+assert len(push._subscriptions) == 1
+assert received.wait(10), events
+unsubscribe[1]()
+ids = [row[0] for row in events[0]]
+assert ids == sorted(set(ids)), ids
+assert [row[0] for row in events[1]] == ids[:len(events[1])]
+print('push: {} events in order'.format(len(ids)))
+
+# stream idle longer than read timeout, subscription reconnects and delivers later samples
+sse_standin.Handler.samples.interval = 2.5
+time.sleep(0.3)
+idle_from = len(events[0])
+deadline = time.time() + 20
+while len({row[0] for row in events[0][idle_from:]}) < 3 and time.time() < deadline:
+    time.sleep(0.1)
+after = [row[0] for row in events[0][idle_from:]]
+assert len(set(after)) >= 3, after
+assert push._subscriptions[url + '/envdata-stream'].is_alive()
+# reconnect repeats newest sample, ingest ignores samples not newer than series
+assert sorted(set(after)) == list(dict.fromkeys(after)), after
+print('push: events after {:.1f} s idle stream: {}'.format(sse_standin.Handler.samples.interval, after))
+unsubscribe[0]()
+
+# no new samples from now on, newest one stays same
+sse_standin.Handler.samples.interval = 60
+time.sleep(0.3)
+last = url + '/envdata-last'
+row = json.loads(client.get(last, conditional=True))
+assert client.get(last, conditional=True) is None, 'ETag of newest sample, 304 expected'
+assert client.get(last, params={'since': row[1]}) is None, 'since newest sample, 204 expected'
+assert json.loads(client.get(last, params={'since': '2000-01-01T00:00:00.000000Z'})) == row
+print('conditional: 304 and 204 answered without body')
+print('ok')
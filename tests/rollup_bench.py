@@ -0,0 +1,109 @@
+# query latency of 1 year range from rollups of visualizer/humidity/rollup.py against raw sample scan
+# also checks rollups kept by SampleCache against statistics computed from raw samples
+# python tests/rollup_bench.py [sample period s]
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, 'visualizer/humidity')
+from cache import SampleCache
+from downsample import minmax_indices
+import rollup
+
+period = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+width = 1600
+end = 1600000000000
+ts = np.arange(end - 365 * rollup.DAY, end, period * 1000, dtype=np.int64)
+values = 45 + 10 * np.sin(np.arange(len(ts)) / 5000) + np.random.default_rng(1).normal(0, 1, len(ts))
+print('{} samples, 1 year at {} s'.format(len(ts), period))
+
+
+def best(func, runs=5):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+directory = tempfile.mkdtemp()
+cache = SampleCache(os.path.join(directory, 'cache.sqlite'))
+rows = list(zip(ts.tolist(), values.tolist()))
+started = time.perf_counter()
+cache.append('device', 'humidity', rows)
+with_rollups = time.perf_counter() - started
+started = time.perf_counter()
+with cache.db:
+    cache.db.executemany('INSERT OR IGNORE INTO samples (device, variable, ts, value) VALUES (?, ?, ?, ?)',
+                         (('device', 'plain', t, value) for t, value in rows))
+print('insert: {:.2f} s with rollups, {:.2f} s plain insert'.format(with_rollups, time.perf_counter() - started))
+
+# rollups against raw statistics
+day = cache.rollups.query('device', 'humidity', rollup.DAY)
+buckets = ts - ts % rollup.DAY
+first = np.searchsorted(buckets, day['bucket'])
+assert np.array_equal(day['count'], np.diff(np.append(first, len(ts))))
+assert np.allclose(day['min'], np.minimum.reduceat(values, first))
+assert np.allclose(day['max'], np.maximum.reduceat(values, first))
+assert np.allclose(day['mean'], np.add.reduceat(values, first) / day['count'])
+assert np.array_equal(day['last'], values[np.append(first[1:], len(ts)) - 1])
+
+# incremental update, duplicate sample does not count twice
+before = cache.rollups.query('device', 'humidity', rollup.DAY, start=end)
+assert cache.append('device', 'humidity', [(int(ts[-1]), 0.0), (end + 1000, 1000.0)]) == 1
+after = cache.rollups.query('device', 'humidity', rollup.DAY, start=end)
+assert after['count'][0] == before['count'][0] + 1 and after['max'][0] == 1000.0 and after['last'][0] == 1000.0
+
+# rollups computed from whole cache are the same
+stats = cache.rollups.query('device', 'humidity', rollup.HOUR)
+cache.rollups.rebuild()
+rebuilt = cache.rollups.query('device', 'humidity', rollup.HOUR)
+assert all(np.allclose(stats[name], rebuilt[name]) for name in stats)
+print('rollups match raw samples')
+
+# whole days, day rollups cover range exactly
+start = end - end % rollup.DAY - 364 * rollup.DAY
+stop = end - end % rollup.DAY - 1
+
+
+def raw_view():
+    x, y = cache.load('device', 'humidity', start, stop)
+    y = np.array(y)
+    picked = minmax_indices(y, -(-len(y) // width))
+    return np.array(x)[picked], y[picked]
+
+
+def rollup_view():
+    return cache.rollups.envelope('device', 'humidity', start, stop, width)
+
+
+def raw_stats():
+    return cache.db.execute('SELECT MIN(value), MAX(value), AVG(value), COUNT(*) FROM samples '
+                            'WHERE device = ? AND variable = ? AND ts BETWEEN ? AND ?',
+                            ('device', 'humidity', start, stop)).fetchone()
+
+
+def rollup_stats():
+    day = cache.rollups.query('device', 'humidity', rollup.DAY, start, stop)
+    return day['min'].min(), day['max'].max(), (day['mean'] * day['count']).sum() / day['count'].sum(), \
+        day['count'].sum()
+
+
+raw_time, raw = best(raw_view, runs=1)
+rollup_time, view = best(rollup_view, runs=1)
+print('1 year view, {} px: raw scan {:.1f} ms ({} points), rollup {:.1f} ms ({} points, resolution {} s)'.format(
+    width, raw_time * 1000, len(raw[0]), rollup_time * 1000, len(view[0]),
+    cache.rollups.resolution(start, stop, width) // 1000))
+raw_time, raw = best(raw_view)
+rollup_time, view = best(rollup_view)
+print('repeated:  raw scan {:.1f} ms, rollup {:.1f} ms, {:.0f}x'.format(
+    raw_time * 1000, rollup_time * 1000, raw_time / rollup_time))
+raw_time, raw = best(raw_stats)
+rollup_time, stats = best(rollup_stats)
+assert raw[3] == stats[3] and np.isclose(raw[2], stats[2])
+print('1 year min/max/mean/count: raw scan {:.1f} ms, day rollup {:.2f} ms, {:.0f}x'.format(
+    raw_time * 1000, rollup_time * 1000, raw_time / rollup_time))
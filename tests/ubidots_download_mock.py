@@ -0,0 +1,107 @@
+# paginated ubidots download of visualizer/humidity/ubidots.py against local mock of values api
+# mock serves two years of samples with start/end/page/page_size, answers some requests with 429 and 503,
+# first run fails some windows for good, second run must download only those and end with complete history
+# python tests/ubidots_download_mock.py
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+sys.path.insert(0, 'visualizer/humidity')
+from cache import SampleCache
+import ubidots
+
+PERIOD_MS = 300 * 1000
+END = 1600000000000
+FIRST = END - 2 * 365 * ubidots.DAY_MS
+SAMPLES = np.arange(FIRST, END, PERIOD_MS, dtype=np.int64)
+print('mock samples: ', len(SAMPLES))
+
+
+class Mock(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    requests = 0
+    broken = set()  # window starts answered with 503 on every try
+    random = random.Random(1)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: value[0] for key, value in parse_qs(url.query).items()}
+        start, end = int(query['start']), int(query['end'])
+        page, page_size = int(query['page']), int(query['page_size'])
+        with self.lock:
+            Mock.requests += 1
+            flaky = self.random.random() < 0.05
+        if start in self.broken:
+            self.reply(503, {})
+            return
+        if flaky:
+            self.reply(self.random.choice([429, 503]), {})
+            return
+        # newest first, as ubidots returns values
+        window = SAMPLES[(SAMPLES >= start) & (SAMPLES <= end)][::-1]
+        part = window[(page - 1) * page_size:page * page_size]
+        results = [{'timestamp': int(ts), 'value': float(ts % 1000003)} for ts in part]
+        has_next = page * page_size < len(window)
+        self.reply(200, {'count': len(window), 'next': 'next' if has_next else None, 'results': results})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), Mock)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = 'http://127.0.0.1:{}/api/v1.6/devices/{{}}/{{}}/values/'.format(server.server_address[1])
+
+db = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+key = (ubidots.PREFIX + 'device', 'humidity')
+
+
+def run(attempts):
+    downloader = ubidots.Downloader(SampleCache(db), 'token', url=url, page_size=500, rate=200,
+                                    attempts=attempts, backoff=0.01)
+    Mock.requests = 0
+    started = time.time()
+    new, failed = downloader.download([key], FIRST, END)
+    print('new samples: {}, failed windows: {}, requests: {}, {:.2f} s'.format(
+        new[key], failed, Mock.requests, time.time() - started))
+    return new[key], failed
+
+
+windows = ubidots.Downloader(None, 'token').windows(FIRST, END)
+Mock.broken = {start for start, end in windows[::10]}
+print('interrupted run')
+first_new, failed = run(attempts=4)
+assert failed == len(Mock.broken), failed
+
+Mock.broken = set()
+print('resumed run')
+second_new, failed = run(attempts=8)
+assert failed == 0
+assert first_new + second_new == len(SAMPLES), (first_new, second_new)
+
+cache = SampleCache(db)
+ts, values = cache.load(*key)
+assert len(ts) == len(SAMPLES) and len(set(ts)) == len(ts)
+assert len(cache.completed_windows(*key)) == len(windows)
+
+print('complete run')
+new, failed = run(attempts=4)
+assert new == 0 and failed == 0 and Mock.requests == 0
+print('ok')
+server.shutdown()
@@ -0,0 +1,107 @@
+# parity of uping.checksum and checksum_update against previous byte pair checksum, and speed across packet sizes
+# runs on CPython and on MicroPython, where viper checksum is used: copy uping.py and this file to board
+# python tests/uping_checksum_bench.py
+# micropython uping_checksum_bench.py
+import sys
+import random
+import struct
+
+sys.path.insert(0, '.')
+from uping import checksum, checksum_update
+
+try:
+    from time import perf_counter
+except ImportError:
+    from utime import ticks_us, ticks_diff
+    _start = ticks_us()
+
+    def perf_counter():
+        return ticks_diff(ticks_us(), _start) / 1000000
+
+
+def reference(data):
+    """
+    uping.checksum before word-at-a-time rewrite
+    """
+    if len(data) & 0x1:
+        data += b'\0'
+    cs = 0
+    for pos in range(0, len(data), 2):
+        b1 = data[pos]
+        b2 = data[pos + 1]
+        cs += (b1 << 8) + b2
+    while cs >= 0x10000:
+        cs = (cs & 0xffff) + (cs >> 16)
+    cs = ~cs & 0xffff
+    return cs
+
+
+def packet(size):
+    return bytes(random.getrandbits(8) for _ in range(size))
+
+
+# full checksum, odd and even sizes, extreme contents
+cases = [packet(size) for size in list(range(0, 130)) + [255, 256, 1472, 1500]]
+cases += [b'\0' * 64, b'\xff' * 64, b'\xff' * 65, b'\x80\x00' * 32]
+for data in cases:
+    assert checksum(data) == reference(data), (len(data), checksum(data), reference(data))
+    assert checksum(bytearray(data)) == reference(data)
+    assert checksum(memoryview(data)) == reference(data)
+print('checksum: {} packets match'.format(len(cases)))
+
+# incremental update of seq and timestamp as in uping._Echo.send, packet with checksum field filled must verify
+for size in (16, 17, 64, 1472):
+    pkt = bytearray(packet(size))
+    pkt[2:4] = b'\0\0'
+    cs = checksum(pkt)
+    for seq in range(1, 2001):
+        old = bytes(pkt[6:16])
+        pkt[6:16] = struct.pack('>hQ', seq - 32768 if seq > 32767 else seq, random.getrandbits(64))
+        cs = checksum_update(cs, old, bytes(pkt[6:16]))
+        assert cs == reference(pkt), (size, seq)
+        pkt[2:4] = struct.pack('>H', cs)
+        assert checksum(pkt) == 0
+        pkt[2:4] = b'\0\0'
+print('checksum_update: matches full checksum')
+
+
+MIN_TIME = 0.1  # s, shortest timed batch
+REPEATS = 5
+
+
+def rate(func, data):
+    """
+    time per call, best of REPEATS batches, each batch runs at least MIN_TIME
+    :return: us per call, calls per batch
+    """
+    func(data)  # warm up
+    runs = 1
+    while True:
+        started = perf_counter()
+        for _ in range(runs):
+            func(data)
+        if perf_counter() - started >= MIN_TIME:
+            break
+        runs *= 2
+    best = None
+    for _ in range(REPEATS):
+        started = perf_counter()
+        for _ in range(runs):
+            func(data)
+        elapsed = perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / runs * 1000000, runs
+
+
+print('time per call, best of {} batches of at least {} ms, calls per batch in brackets'.format(
+    REPEATS, int(MIN_TIME * 1000)))
+print('size  previous (us)            checksum (us)      speedup  update (us)')
+for size in (16, 64, 256, 1024, 1472):
+    data = packet(size)
+    old, new = data[6:16], packet(10)
+    before, before_runs = rate(reference, data)
+    after, after_runs = rate(checksum, data)
+    update, update_runs = rate(lambda _: checksum_update(0x1234, old, new), data)
+    print('{:5d}  {:8.2f} ({:7d})  {:13.2f} ({:7d})  {:6.1f}x  {:8.2f} ({:7d})'.format(
+        size, before, before_runs, after, after_runs, before / after, update, update_runs))
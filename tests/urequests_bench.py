@@ -0,0 +1,135 @@
+# micro benchmark of urequests write path
+# counts socket writes and heap allocation (MicroPython) or peak memory (CPython) per request against fake socket
+# runs on unix port of MicroPython or CPython: python tests/urequests_bench.py
+import sys
+import time
+
+sys.path.insert(0, '.')
+try:
+    import usocket
+except ImportError:
+    # CPython, urequests only needs the names below from usocket
+    import json
+    import types
+    usocket = types.ModuleType('usocket')
+    usocket.SOCK_STREAM = 1
+    sys.modules['usocket'] = usocket
+    sys.modules.setdefault('ujson', json)
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+class FakeSocket:
+    """
+    records writes, answers every request with RESPONSE
+    """
+    writes = 0
+    written = 0
+
+    def __init__(self, *args):
+        self.pos = 0
+
+    def connect(self, addr):
+        pass
+
+    def write(self, data):
+        FakeSocket.writes += 1
+        FakeSocket.written += len(data)
+        # request is complete, rewind response
+        self.pos = 0
+        return len(data)
+
+    def readline(self):
+        end = RESPONSE.find(b"\n", self.pos) + 1 or len(RESPONSE)
+        line = RESPONSE[self.pos:end]
+        self.pos = end
+        return line
+
+    def read(self, n=-1):
+        end = len(RESPONSE) if n < 0 else self.pos + n
+        data = RESPONSE[self.pos:end]
+        self.pos = end
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+usocket.socket = FakeSocket
+usocket.getaddrinfo = lambda host, port, af=0, type=0: [(2, 1, 0, '', (host, port))]
+
+import urequests
+
+try:
+    import gc
+
+    def allocated(fn, n):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        fn(n)
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used / n
+    ALLOC_UNIT = 'bytes allocated/req'
+    gc.mem_alloc
+except AttributeError:
+    import tracemalloc
+
+    def allocated(fn, n):
+        tracemalloc.start()
+        total = 0
+        for _ in range(n):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(1)
+            total += tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        return total / n
+    # CPython frees most objects right away, mean peak of memory in use during single request is reported
+    ALLOC_UNIT = 'bytes peak/req'
+
+URL = "http://192.168.0.14:5000/envdata"
+HEADERS = {b"X-Auth-Token": b"BBFF-0123456789abcdef", b"Content-Type": b"application/x-envmon"}
+BODY = bytearray(42)
+session = urequests.Session()
+
+
+def module_post(n):
+    for _ in range(n):
+        r = urequests.post(URL, headers=HEADERS, data=BODY)
+        r.content
+
+
+def session_post(n):
+    for _ in range(n):
+        r = session.post(URL, headers=HEADERS, data=BODY)
+        r.content
+
+
+def session_stream(n):
+    for _ in range(n):
+        r = session.post(URL, headers=HEADERS, data=(BODY, BODY, BODY))
+        r.content
+
+
+def run(name, fn, n=1000):
+    fn(10)  # warm up
+    FakeSocket.writes = 0
+    FakeSocket.written = 0
+    start = time.time()
+    fn(n)
+    elapsed = time.time() - start
+    print('{:16} {:5.1f} writes/req {:6.0f} bytes/req {:8.1f} us/req {:8.1f} {}'.format(
+        name, FakeSocket.writes / n, FakeSocket.written / n, elapsed * 1e6 / n,
+        allocated(fn, 100), ALLOC_UNIT))
+
+
+run('module post', module_post)
+run('session post', session_post)
+run('session chunked', session_stream)
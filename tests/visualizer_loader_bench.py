@@ -0,0 +1,59 @@
+# benchmark of columnar history parsing in visualizer/humidity/loader.py
+# against the per row loop it replaced, synthetic 1M row responses
+# python tests/visualizer_loader_bench.py [rows]
+import sys
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, 'visualizer/humidity')
+import loader
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+start = datetime(2019, 1, 1)
+envdata = json.dumps([[i, (start + timedelta(seconds=10 * i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                       21.5, 45.25 + i % 7, 990.1] for i in range(n)]).encode()
+first_ms = int(start.timestamp() * 1000)
+ubidots = json.dumps({'results': [{'timestamp': first_ms + 10000 * i, 'value': 45.25 + i % 7}
+                                  for i in reversed(range(n))]}).encode()
+print('{} rows, envdata {:.0f} MB, ubidots {:.0f} MB, json parser: {}'.format(
+    n, len(envdata) / 1e6, len(ubidots) / 1e6, loader.loads.__module__))
+
+
+def loop_envdata(content):
+    time1 = []
+    value1 = []
+    for each in json.loads(content):
+        time1.append(datetime.strptime(each[1], '%Y-%m-%dT%H:%M:%S.%fZ'))
+        value1.append(each[3])
+    return time1, value1
+
+
+def loop_ubidots(content):
+    time1 = []
+    value1 = []
+    for each in json.loads(content)['results']:
+        time1.append(datetime.fromtimestamp(each['timestamp'] // 1000))
+        value1.append(each['value'])
+    time1.reverse()
+    value1.reverse()
+    return time1, value1
+
+
+def timed(fn, *args):
+    t = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t, result
+
+
+for name, loop, columnar, content in (
+        ('envdata', loop_envdata, loader.parse_envdata, envdata),
+        ('ubidots', loop_ubidots, loader.parse_ubidots, ubidots)):
+    t_loop, (time1, value1) = timed(loop, content)
+    t_columnar, (ts, values) = timed(columnar, content)
+    # same timestamps as the loop produced
+    assert (np.array(time1, dtype='datetime64[ms]').astype(np.int64) == ts).all()
+    assert (np.array(value1) == values).all()
+    print('{:8} loop {:6.2f} s  columnar {:6.2f} s  {:5.1f}x'.format(name, t_loop, t_columnar, t_loop / t_columnar))
@@ -2,106 +2,241 @@
 # copyright (c) 2018 Shawwwn <shawwwn1@gmail.com>
 # License: MIT
 
-# Internet Checksum Algorithm
-# Author: Olav Morken
-# https://github.com/olavmrk/python-ping/blob/master/ping.py
-# @data: bytes
-def checksum(data):
-    if len(data) & 0x1: # Odd number of bytes
-        data += b'\0'
-    cs = 0
-    for pos in range(0, len(data), 2):
-        b1 = data[pos]
-        b2 = data[pos + 1]
-        cs += (b1 << 8) + b2
+import sys
+from array import array
+
+# Internet Checksum Algorithm, RFC 1071
+# ones' complement sum is byte order independent: words are summed in native order
+# and folded sum is swapped to network order on little endian machines
+_SWAP = sys.byteorder == 'little'
+
+
+# @data: bytes-like
+# @return: folded 16-bit ones' complement sum of data as big endian words, odd byte padded with zero
+def _sum16(data):
+    n = len(data)
+    even = n & ~1
+    try:
+        words = memoryview(data)[:even].cast('H')
+    except AttributeError: # no memoryview.cast in MicroPython, array copies raw bytes
+        words = array('H', bytes(data[:even]))
+    cs = sum(words)
+    if n & 1:
+        cs += data[-1] if _SWAP else data[-1] << 8
     while cs >= 0x10000:
         cs = (cs & 0xffff) + (cs >> 16)
-    cs = ~cs & 0xffff
+    if _SWAP:
+        cs = ((cs & 0xff) << 8) | (cs >> 8)
     return cs
 
-def ping(host, count=4, timeout=5000, interval=10, quiet=False, size=64):
-    import utime
-    import uselect
+
+try:
+    import micropython
+except ImportError:
+    micropython = None
+
+if micropython:
+    # native loop over bytes, needs port with viper emitter (esp32 has it)
+    @micropython.viper
+    def _sum16(data) -> int:
+        n = int(len(data))
+        p = ptr8(data)
+        cs = 0
+        i = 0
+        while i < n - 1:
+            cs += (p[i] << 8) | p[i + 1]
+            i += 2
+        if n & 1:
+            cs += p[n - 1] << 8
+        cs = (cs & 0xffff) + (cs >> 16)
+        cs = (cs & 0xffff) + (cs >> 16)
+        return cs
+
+
+# @data: bytes-like
+def checksum(data):
+    return ~_sum16(data) & 0xffff
+
+
+# incremental update of checksum, RFC 1624 eqn. 3: HC' = ~(~HC + ~m + m')
+# @cs: checksum of packet before change
+# @old, @new: changed field before and after, same length, starting at even offset of packet
+def checksum_update(cs, old, new):
+    cs = (~cs & 0xffff) + (~_sum16(old) & 0xffff) + _sum16(new)
+    while cs >= 0x10000:
+        cs = (cs & 0xffff) + (cs >> 16)
+    return ~cs & 0xffff
+
+# packet header descriptor
+def _header_desc():
     import uctypes
-    import usocket
-    import ustruct
-    import urandom
-
-    # prepare packet
-    assert size >= 16, "pkt size too small"
-    pkt = b'Q'*size
-    pkt_desc = {
+    return {
         "type": uctypes.UINT8 | 0,
         "code": uctypes.UINT8 | 1,
         "checksum": uctypes.UINT16 | 2,
         "id": uctypes.UINT16 | 4,
         "seq": uctypes.INT16 | 6,
         "timestamp": uctypes.UINT64 | 8,
-    } # packet header descriptor
-    h = uctypes.struct(uctypes.addressof(pkt), pkt_desc, uctypes.BIG_ENDIAN)
-    h.type = 8 # ICMP_ECHO_REQUEST
-    h.code = 0
-    h.checksum = 0
-    h.id = urandom.randint(0, 65535)
-    h.seq = 1
-
-    # init socket
-    sock = usocket.socket(usocket.AF_INET, usocket.SOCK_RAW, 1)
-    sock.setblocking(0)
-    sock.settimeout(timeout/1000)
-    addr = usocket.getaddrinfo(host, 1)[0][-1][0] # ip address
-    sock.connect((addr, 1))
-    not quiet and print("PING %s (%s): %u data bytes" % (host, addr, len(pkt)))
-
-    seqs = list(range(1, count+1)) # [1,2,...,count]
-    c = 1
-    t = 0
-    n_trans = 0
-    n_recv = 0
-    finish = False
-    while t < timeout:
-        if t==interval and c<=count:
-            # send packet
+    }
+
+
+class _Echo:
+    """
+    echo request packet, raw socket and replies of one ping run
+    """
+    def __init__(self, host, count, size, quiet):
+        import uctypes
+        import usocket
+        import urandom
+
+        assert size >= 16, "pkt size too small"
+        self.count = count
+        self.quiet = quiet
+        self.desc = _header_desc()
+        self.pkt = b'Q'*size
+        self.h = uctypes.struct(uctypes.addressof(self.pkt), self.desc, uctypes.BIG_ENDIAN)
+        self.h.type = 8 # ICMP_ECHO_REQUEST
+        self.h.code = 0
+        self.h.checksum = 0
+        self.h.id = urandom.randint(0, 65535)
+        self.h.seq = 1
+
+        self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_RAW, 1)
+        try:
+            self.sock.setblocking(False)
+            self.addr = usocket.getaddrinfo(host, 1)[0][-1][0] # ip address
+            self.sock.connect((self.addr, 1))
+        except:
+            self.sock.close()
+            raise
+        not quiet and print("PING %s (%s): %u data bytes" % (host, self.addr, len(self.pkt)))
+
+        self.seq = 1 # next seq to send
+        self.pending = []
+        self.n_trans = 0
+        self.rtts = []
+
+    def done(self):
+        return self.seq > self.count and not self.pending
+
+    def send(self):
+        import utime
+        h = self.h
+        old = self.pkt[6:16] # seq and timestamp, only fields changing between requests
+        h.seq = self.seq
+        h.timestamp = utime.ticks_us()
+        if self.seq == 1:
             h.checksum = 0
-            h.seq = c
-            h.timestamp = utime.ticks_us()
-            h.checksum = checksum(pkt)
-            if sock.send(pkt) == size:
-                n_trans += 1
-                t = 0 # reset timeout
-            else:
-                seqs.remove(c)
-            c += 1
-
-        # recv packet
-        while 1:
-            socks, _, _ = uselect.select([sock], [], [], 0)
-            if socks:
-                resp = socks[0].recv(4096)
-                resp_mv = memoryview(resp)
-                h2 = uctypes.struct(uctypes.addressof(resp_mv[20:]), pkt_desc, uctypes.BIG_ENDIAN)
-                # TODO: validate checksum (optional)
-                seq = h2.seq
-                if h2.type==0 and h2.id==h.id and (seq in seqs): # 0: ICMP_ECHO_REPLY
-                    t_elasped = (utime.ticks_us()-h2.timestamp) / 1000
-                    ttl = ustruct.unpack('!B', resp_mv[8:9])[0] # time-to-live
-                    n_recv += 1
-                    not quiet and print("%u bytes from %s: icmp_seq=%u, ttl=%u, time=%f ms" % (len(resp), addr, seq, ttl, t_elasped))
-                    seqs.remove(seq)
-                    if len(seqs) == 0:
-                        finish = True
-                        break
-            else:
+            h.checksum = checksum(self.pkt)
+        else:
+            h.checksum = checksum_update(h.checksum, old, self.pkt[6:16])
+        if self.sock.send(self.pkt) == len(self.pkt):
+            self.n_trans += 1
+            self.pending.append(self.seq)
+        self.seq += 1
+
+    def receive(self, resp):
+        """
+        takes reply from socket, others' replies are ignored
+        """
+        import utime
+        import uctypes
+        import ustruct
+        resp_mv = memoryview(resp)
+        h2 = uctypes.struct(uctypes.addressof(resp_mv[20:]), self.desc, uctypes.BIG_ENDIAN)
+        seq = h2.seq
+        if h2.type==0 and h2.id==self.h.id and (seq in self.pending): # 0: ICMP_ECHO_REPLY
+            rtt = utime.ticks_diff(utime.ticks_us(), h2.timestamp) / 1000
+            self.rtts.append(rtt)
+            self.pending.remove(seq)
+            if not self.quiet:
+                ttl = ustruct.unpack('!B', resp_mv[8:9])[0] # time-to-live
+                print("%u bytes from %s: icmp_seq=%u, ttl=%u, time=%f ms" % (len(resp), self.addr, seq, ttl, rtt))
+
+    def result(self):
+        """
+        :return: n_trans, n_recv, rtt min, avg, max and jitter (mean difference of consecutive rtts) in ms,
+            rtt values are None without replies
+        """
+        rtts = self.rtts
+        n_recv = len(rtts)
+        not self.quiet and print("%u packets transmitted, %u packets received" % (self.n_trans, n_recv))
+        if not rtts:
+            return (self.n_trans, 0, None, None, None, None)
+        jitter = 0
+        for i in range(1, n_recv):
+            jitter += abs(rtts[i] - rtts[i - 1])
+        if n_recv > 1:
+            jitter /= n_recv - 1
+        return (self.n_trans, n_recv, min(rtts), sum(rtts) / n_recv, max(rtts), jitter)
+
+
+def ping(host, count=4, timeout=5000, interval=10, quiet=False, size=64):
+    """
+    sends count echo requests interval ms apart, waits for replies up to timeout ms after last request
+    sleeps in poll until next request is due or reply arrives
+    :return: n_trans, n_recv, rtt min, avg, max, jitter (ms)
+    """
+    import utime
+    import uselect
+
+    echo = _Echo(host, count, size, quiet)
+    poller = uselect.poll()
+    poller.register(echo.sock, uselect.POLLIN)
+    try:
+        next_send = utime.ticks_ms()
+        deadline = utime.ticks_add(next_send, timeout)
+        while not echo.done():
+            now = utime.ticks_ms()
+            if echo.seq <= count and utime.ticks_diff(next_send, now) <= 0:
+                echo.send()
+                next_send = utime.ticks_add(now, interval)
+                deadline = utime.ticks_add(now, timeout)
+                continue
+            wait = utime.ticks_diff(deadline, now)
+            if wait <= 0:
                 break
+            if echo.seq <= count:
+                wait = min(wait, utime.ticks_diff(next_send, now))
+            # entries may hold more than (obj, event)
+            for entry in poller.poll(max(wait, 0)):
+                if entry[1] & uselect.POLLIN:
+                    echo.receive(echo.sock.recv(4096))
+    finally:
+        poller.unregister(echo.sock)
+        echo.sock.close()
+    return echo.result()
 
-        if finish:
-            break
 
-        utime.sleep_ms(1)
-        t += 1
+async def ping_async(host, count=4, timeout=5000, interval=10, quiet=False, size=64):
+    """
+    ping() for uasyncio, other tasks run while replies are awaited
+    :return: same as ping()
+    """
+    import utime
+    import uasyncio
 
-    # close
-    sock.close()
-    ret = (n_trans, n_recv)
-    not quiet and print("%u packets transmitted, %u packets received" % (n_trans, n_recv))
-    return (n_trans, n_recv)
+    echo = _Echo(host, count, size, quiet)
+    try:
+        reader = uasyncio.StreamReader(echo.sock)
+        next_send = utime.ticks_ms()
+        deadline = utime.ticks_add(next_send, timeout)
+        while not echo.done():
+            now = utime.ticks_ms()
+            if echo.seq <= count and utime.ticks_diff(next_send, now) <= 0:
+                echo.send()
+                next_send = utime.ticks_add(now, interval)
+                deadline = utime.ticks_add(now, timeout)
+                continue
+            wait = utime.ticks_diff(deadline, now)
+            if wait <= 0:
+                break
+            if echo.seq <= count:
+                wait = min(wait, utime.ticks_diff(next_send, now))
+            try:
+                echo.receive(await uasyncio.wait_for_ms(reader.read(4096), max(wait, 1)))
+            except uasyncio.TimeoutError:
+                pass
+    finally:
+        echo.sock.close()
+    return echo.result()
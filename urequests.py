@@ -2,10 +2,17 @@ import usocket
 
 class Response:
 
-    def __init__(self, f):
+    def __init__(self, f, length=None, chunked=False, release=None):
         self.raw = f
         self.encoding = "utf-8"
         self._cached = None
+        # body framing: bytes left in body or in current chunk,
+        # None without chunked means body ends with connection
+        self._left = 0 if chunked else length
+        self._chunked = chunked
+        self._chunk_started = False
+        # called with the socket once body was read completely, keep-alive only
+        self._release = release
 
     def close(self):
         if self.raw:
@@ -13,14 +20,87 @@ class Response:
             self.raw = None
         self._cached = None
 
+    def _end(self):
+        # body was read completely
+        if self._release:
+            self._release(self.raw)
+        else:
+            self.raw.close()
+        self.raw = None
+
+    def _next_chunk(self):
+        # reads chunk size line, returns False after last chunk
+        if self._chunk_started:
+            self.raw.readline()  # CRLF after previous chunk data
+        self._chunk_started = True
+        size = int(self.raw.readline().split(b";", 1)[0], 16)
+        if size == 0:
+            # skip trailers
+            while self.raw.readline() not in (b"\r\n", b""):
+                pass
+            return False
+        self._left = size
+        return True
+
+    def readinto(self, buf):
+        """
+        reads next part of body into buf, chunked encoding is decoded
+        returns number of bytes stored, 0 at end of body
+        connection is released or closed once body end is reached
+        """
+        if self.raw is None:
+            return 0
+        if self._left == 0:
+            if not self._chunked or not self._next_chunk():
+                self._end()
+                return 0
+        if self._left is not None and self._left < len(buf):
+            n = self.raw.readinto(memoryview(buf)[:self._left])
+        else:
+            n = self.raw.readinto(buf)
+        if not n:
+            # connection closed by server
+            self.close()
+            return 0
+        if self._left is not None:
+            self._left -= n
+            if self._left == 0 and not self._chunked:
+                self._end()
+        return n
+
+    def iter_content(self, chunk_size=1024):
+        """
+        yields body in parts of at most chunk_size bytes
+        only one buffer of chunk_size is held, body is never read whole
+        """
+        buf = bytearray(chunk_size)
+        while True:
+            n = self.readinto(buf)
+            if not n:
+                break
+            yield bytes(memoryview(buf)[:n])
+
+    def _read_all(self):
+        if not self._chunked:
+            if self._left is None:
+                return self.raw.read()
+            if self._left == 0:
+                return b""
+            return self.raw.read(self._left)
+        body = b""
+        while self._next_chunk():
+            body += self.raw.read(self._left)
+        return body
+
     @property
     def content(self):
         if self._cached is None:
             try:
-                self._cached = self.raw.read()
-            finally:
-                self.raw.close()
-                self.raw = None
+                self._cached = self._read_all()
+            except:
+                self.close()
+                raise
+            self._end()
         return self._cached
 
     @property
@@ -32,7 +112,7 @@ class Response:
         return ujson.loads(self.content)
 
 
-def request(method, url, data=None, json=None, headers={}, stream=None):
+def _parse_url(url):
     try:
         proto, dummy, host, path = url.split("/", 3)
     except ValueError:
@@ -41,7 +121,6 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
     if proto == "http:":
         port = 80
     elif proto == "https:":
-        import ussl
         port = 443
     else:
         raise ValueError("Unsupported protocol: " + proto)
@@ -49,62 +128,338 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
     if ":" in host:
         host, port = host.split(":", 1)
         port = int(port)
+    return proto, host, port, path
 
-    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
-    ai = ai[0]
 
+def _connect(proto, host, ai, timeout=None):
     s = usocket.socket(ai[0], ai[1], ai[2])
     try:
+        if timeout is not None:
+            s.settimeout(timeout)
         s.connect(ai[-1])
+        if timeout is not None:
+            s.settimeout(None)
         if proto == "https:":
+            import ussl
             s = ussl.wrap_socket(s, server_hostname=host)
-        s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
-        if not "Host" in headers:
-            s.write(b"Host: %s\r\n" % host)
-        # Iterate over keys to avoid tuple alloc
-        for k in headers:
-            s.write(k)
-            s.write(b": ")
-            s.write(headers[k])
-            s.write(b"\r\n")
-        if json is not None:
-            assert data is None
-            import ujson
-            data = ujson.dumps(json)
-            s.write(b"Content-Type: application/json\r\n")
-        if data:
-            s.write(b"Content-Length: %d\r\n" % len(data))
-        s.write(b"\r\n")
-        if data:
-            s.write(data)
+    except OSError:
+        s.close()
+        raise
+    return s
 
-        l = s.readline()
-        #print(l)
-        l = l.split(None, 2)
-        status = int(l[1])
-        reason = ""
-        if len(l) > 2:
-            reason = l[2].rstrip()
+
+def _is_stream(data):
+    return data is not None and not isinstance(data, (bytes, bytearray, memoryview, str))
+
+
+_METHODS = {"GET": b"GET", "HEAD": b"HEAD", "POST": b"POST", "PUT": b"PUT",
+            "PATCH": b"PATCH", "DELETE": b"DELETE"}
+_DIGITS = b"0123456789abcdef"
+
+
+class RequestBuffer:
+    """
+    assembles request line, headers and body in one preallocated buffer
+    whole request goes out with single socket write when it fits,
+    larger requests are flushed whenever buffer fills up
+    str values are encoded on the way, pass bytes to avoid allocation
+    """
+
+    def __init__(self, size=512):
+        self.buf = bytearray(size)
+        self.pos = 0
+        self.sock = None
+
+    def begin(self, sock):
+        self.sock = sock
+        self.pos = 0
+
+    def flush(self):
+        if self.pos:
+            self.sock.write(memoryview(self.buf)[:self.pos])
+            self.pos = 0
+
+    def add(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        n = len(data)
+        if self.pos + n > len(self.buf):
+            self.flush()
+            if n > len(self.buf):
+                self.sock.write(data)
+                return
+        self.buf[self.pos:self.pos + n] = data
+        self.pos += n
+
+    def add_int(self, n, base=10):
+        """
+        adds ascii representation of non negative integer without formatting
+        """
+        if self.pos + 16 > len(self.buf):
+            self.flush()
+        end = self.pos
+        m = n
         while True:
-            l = s.readline()
-            if not l or l == b"\r\n":
+            end += 1
+            m //= base
+            if not m:
                 break
-            #print(l)
-            if l.startswith(b"Transfer-Encoding:"):
-                if b"chunked" in l:
-                    raise ValueError("Unsupported " + l)
-            elif l.startswith(b"Location:") and not 200 <= status <= 299:
-                raise NotImplementedError("Redirects not yet supported")
+        i = end
+        while True:
+            i -= 1
+            self.buf[i] = _DIGITS[n % base]
+            n //= base
+            if not n:
+                break
+        self.pos = end
+
+
+def _write_request(w, s, method, host, path, data, json, headers, version, close=False):
+    w.begin(s)
+    w.add(_METHODS.get(method, method))
+    w.add(b" /")
+    w.add(path)
+    w.add(b" ")
+    w.add(version)
+    w.add(b"\r\n")
+    if not ("Host" in headers or b"Host" in headers):
+        w.add(b"Host: ")
+        w.add(host)
+        w.add(b"\r\n")
+    # Iterate over keys to avoid tuple alloc
+    for k in headers:
+        w.add(k)
+        w.add(b": ")
+        w.add(headers[k])
+        w.add(b"\r\n")
+    if json is not None:
+        assert data is None
+        import ujson
+        data = ujson.dumps(json)
+        w.add(b"Content-Type: application/json\r\n")
+    if close:
+        w.add(b"Connection: close\r\n")
+    if _is_stream(data):
+        # iterable body, each non empty part is one chunk
+        w.add(b"Transfer-Encoding: chunked\r\n\r\n")
+        for part in data:
+            if part:
+                w.add_int(len(part), 16)
+                w.add(b"\r\n")
+                w.add(part)
+                w.add(b"\r\n")
+        w.add(b"0\r\n\r\n")
+        w.flush()
+        return
+    if isinstance(data, str):
+        data = data.encode()
+    if data:
+        w.add(b"Content-Length: ")
+        w.add_int(len(data))
+        w.add(b"\r\n")
+    elif version != b"HTTP/1.0" and method in ("POST", "PUT", "PATCH"):
+        w.add(b"Content-Length: 0\r\n")
+    w.add(b"\r\n")
+    if data:
+        w.add(data)
+    w.flush()
+
+
+class _Lines:
+    # readline() over header lines already read, lets async client reuse _read_head
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.i = 0
+
+    def readline(self):
+        if self.i == len(self.lines):
+            return b""
+        self.i += 1
+        return self.lines[self.i - 1]
+
+
+def _read_head(s, method):
+    """
+    reads status line and headers
+    returns status, reason, body length, chunked, keep-alive
+    """
+    l = s.readline()
+    #print(l)
+    if not l:
+        raise OSError("connection closed")
+    l = l.split(None, 2)
+    keep_alive = l[0] == b"HTTP/1.1"
+    status = int(l[1])
+    reason = ""
+    if len(l) > 2:
+        reason = l[2].rstrip()
+    length = None
+    chunked = False
+    while True:
+        l = s.readline()
+        if not l or l == b"\r\n":
+            break
+        #print(l)
+        l = l.lower()
+        if l.startswith(b"transfer-encoding:"):
+            chunked = b"chunked" in l
+        elif l.startswith(b"content-length:"):
+            length = int(l[15:])
+        elif l.startswith(b"connection:"):
+            if b"close" in l:
+                keep_alive = False
+            elif b"keep-alive" in l:
+                keep_alive = True
+        elif l.startswith(b"location:") and not 200 <= status <= 299:
+            raise NotImplementedError("Redirects not yet supported")
+    if method == "HEAD" or status == 204 or status == 304:
+        length = 0
+        chunked = False
+    if length is None and not chunked:
+        # body is delimited by connection close
+        keep_alive = False
+    return status, reason, length, chunked, keep_alive
+
+
+# shared by module level requests, they are not reentrant
+_buffer = RequestBuffer()
+
+
+def request(method, url, data=None, json=None, headers={}, stream=None):
+    """
+    data may be bytes, bytearray or memoryview with pre serialized body,
+    it is copied into request buffer and sent together with headers
+    """
+    proto, host, port, path = _parse_url(url)
+
+    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+    ai = ai[0]
+
+    s = _connect(proto, host, ai)
+    try:
+        if _is_stream(data):
+            # chunked request body needs HTTP/1.1
+            _write_request(_buffer, s, method, host, path, data, json, headers, b"HTTP/1.1", close=True)
+        else:
+            _write_request(_buffer, s, method, host, path, data, json, headers, b"HTTP/1.0")
+        status, reason, length, chunked, keep_alive = _read_head(s, method)
     except OSError:
         s.close()
         raise
 
-    resp = Response(s)
+    resp = Response(s, length, chunked)
     resp.status_code = status
     resp.reason = reason
     return resp
 
 
+class Session:
+    """
+    HTTP/1.1 client keeping connections open between requests
+    one idle connection is kept per protocol, host and port,
+    resolved addresses are cached for the session lifetime
+    connection is returned to session after response body was read
+    iterable data is sent chunked and is not retried on dropped connection
+    """
+
+    def __init__(self, buffer_size=512):
+        self._conns = {}
+        self._addrs = {}
+        self._buffer = RequestBuffer(buffer_size)
+
+    def _resolve(self, host, port):
+        key = (host, port)
+        ai = self._addrs.get(key)
+        if ai is None:
+            ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)[0]
+            self._addrs[key] = ai
+        return ai
+
+    def _release(self, key, s):
+        old = self._conns.get(key)
+        if old is not None:
+            old.close()
+        self._conns[key] = s
+
+    def request(self, method, url, data=None, json=None, headers={}, stream=None):
+        proto, host, port, path = _parse_url(url)
+        key = (proto, host, port)
+
+        s = self._conns.pop(key, None)
+        reused = s is not None
+        while True:
+            if s is None:
+                try:
+                    s = _connect(proto, host, self._resolve(host, port))
+                except OSError:
+                    # resolve again next time, address may be stale
+                    self._addrs.pop((host, port), None)
+                    raise
+            try:
+                _write_request(self._buffer, s, method, host, path, data, json, headers, b"HTTP/1.1")
+                status, reason, length, chunked, keep_alive = _read_head(s, method)
+                break
+            except (OSError, IndexError, ValueError):
+                s.close()
+                if not reused or _is_stream(data):
+                    raise
+                # idle connection was dropped by server, retry once on new one
+                s = None
+                reused = False
+
+        release = None
+        if keep_alive:
+            def release(sock):
+                self._release(key, sock)
+        resp = Response(s, length, chunked, release)
+        resp.status_code = status
+        resp.reason = reason
+        return resp
+
+    def connect(self, url, timeout=None):
+        """
+        opens connection to server of url ahead of first request, next request to it uses this connection
+        :param timeout: connect timeout in seconds, None waits as long as socket does
+        """
+        proto, host, port, path = _parse_url(url)
+        key = (proto, host, port)
+        if key in self._conns:
+            return
+        try:
+            s = _connect(proto, host, self._resolve(host, port), timeout)
+        except OSError:
+            self._addrs.pop((host, port), None)
+            raise
+        self._release(key, s)
+
+    def close(self):
+        """
+        closes all idle connections
+        """
+        for key in self._conns:
+            self._conns[key].close()
+        self._conns = {}
+
+    def head(self, url, **kw):
+        return self.request("HEAD", url, **kw)
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+    def put(self, url, **kw):
+        return self.request("PUT", url, **kw)
+
+    def patch(self, url, **kw):
+        return self.request("PATCH", url, **kw)
+
+    def delete(self, url, **kw):
+        return self.request("DELETE", url, **kw)
+
+
 def head(url, **kw):
     return request("HEAD", url, **kw)
 
@@ -121,4 +476,4 @@ def patch(url, **kw):
     return request("PATCH", url, **kw)
 
 def delete(url, **kw):
-    return request("DELETE", url, **kw)
\ No newline at end of file
+    return request("DELETE", url, **kw)
@@ -0,0 +1,121 @@
+# asynchronous counterpart of urequests.request built on uasyncio streams
+# falls back to asyncio on CPython
+# one connection per request, several requests can be in flight at once:
+#   r1, r2 = await asyncio.gather(post(url1, json=a), post(url2, json=b))
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+import urequests
+
+
+class Response:
+
+    def __init__(self, reader, writer, length, chunked):
+        self.reader = reader
+        self.writer = writer
+        self.encoding = "utf-8"
+        self._length = length
+        self._chunked = chunked
+        self._cached = None
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+            self.reader = None
+
+    async def _read_body(self):
+        if not self._chunked:
+            if self._length is None:
+                return await self.reader.read(-1)
+            if self._length == 0:
+                return b""
+            return await self.reader.readexactly(self._length)
+        body = b""
+        while True:
+            size = int((await self.reader.readline()).split(b";", 1)[0], 16)
+            if size == 0:
+                break
+            body += await self.reader.readexactly(size)
+            await self.reader.readline()
+        # skip trailers
+        while (await self.reader.readline()) not in (b"\r\n", b""):
+            pass
+        return body
+
+    async def content(self):
+        if self._cached is None:
+            try:
+                self._cached = await self._read_body()
+            finally:
+                await self.close()
+        return self._cached
+
+    async def text(self):
+        return str(await self.content(), self.encoding)
+
+    async def json(self):
+        import ujson
+        return ujson.loads(await self.content())
+
+
+async def _request(method, url, data, json, headers):
+    proto, host, port, path = urequests._parse_url(url)
+    if proto == "https:":
+        reader, writer = await asyncio.open_connection(host, port, ssl=True)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        # writer buffers data, request goes out on drain
+        w = urequests.RequestBuffer()
+        urequests._write_request(w, writer, method, host, path, data, json, headers, b"HTTP/1.1", close=True)
+        await writer.drain()
+
+        lines = []
+        while True:
+            l = await reader.readline()
+            lines.append(l)
+            if not l or l == b"\r\n":
+                break
+        status, reason, length, chunked, keep_alive = urequests._read_head(urequests._Lines(lines), method)
+    except:
+        writer.close()
+        raise
+
+    resp = Response(reader, writer, length, chunked)
+    resp.status_code = status
+    resp.reason = reason
+    return resp
+
+
+async def request(method, url, data=None, json=None, headers={}, timeout=None):
+    """
+    sends request, returns Response once status line and headers arrived
+    :param timeout: seconds to wait for response head, None waits forever
+    """
+    if timeout is None:
+        return await _request(method, url, data, json, headers)
+    return await asyncio.wait_for(_request(method, url, data, json, headers), timeout)
+
+
+async def head(url, **kw):
+    return await request("HEAD", url, **kw)
+
+async def get(url, **kw):
+    return await request("GET", url, **kw)
+
+async def post(url, **kw):
+    return await request("POST", url, **kw)
+
+async def put(url, **kw):
+    return await request("PUT", url, **kw)
+
+async def patch(url, **kw):
+    return await request("PATCH", url, **kw)
+
+async def delete(url, **kw):
+    return await request("DELETE", url, **kw)
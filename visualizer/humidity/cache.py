@@ -0,0 +1,116 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from rollup import Rollups
+
+EPOCH = datetime(1970, 1, 1)
+MS = timedelta(milliseconds=1)
+
+
+def to_ms(dt):
+    """
+    naive datetime to milliseconds, same conversion as bokeh uses for datetime axis
+    """
+    return (dt - EPOCH) // MS
+
+
+def from_ms(ms):
+    return EPOCH + ms * MS
+
+
+class SampleCache:
+    """
+    persistent local store of downloaded samples
+    one series per device and variable, timestamps in milliseconds (see to_ms)
+    """
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS samples ('
+                        'device TEXT, variable TEXT, ts INTEGER, value REAL, '
+                        'PRIMARY KEY (device, variable, ts)) WITHOUT ROWID')
+        # completed download windows, see ubidots.Downloader
+        self.db.execute('CREATE TABLE IF NOT EXISTS downloads ('
+                        'device TEXT, variable TEXT, start INTEGER, end INTEGER, '
+                        'PRIMARY KEY (device, variable, start)) WITHOUT ROWID')
+        # samples of one append before they are stored, to find the new ones
+        self.db.execute('CREATE TEMP TABLE staging (ts INTEGER PRIMARY KEY, value REAL)')
+        self.db.commit()
+        self.rollups = Rollups(self.db)
+
+    def last_timestamp(self, device, variable):
+        """
+        :return: newest cached timestamp (ms) or None for empty series
+        """
+        row = self.db.execute('SELECT MAX(ts) FROM samples WHERE device = ? AND variable = ?',
+                              (device, variable)).fetchone()
+        return row[0]
+
+    def load(self, device, variable, start=None, end=None, limit=None):
+        """
+        loads series ordered by time
+        :param start: first timestamp (ms), None from beginning
+        :param end: last timestamp (ms), None up to newest
+        :param limit: loads only newest limit samples of the range
+        :return: list of timestamps (ms), list of values
+        """
+        query = 'SELECT ts, value FROM samples WHERE device = ? AND variable = ?'
+        params = [device, variable]
+        if start is not None:
+            query += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND ts <= ?'
+            params.append(end)
+        if limit is not None:
+            rows = self.db.execute(query + ' ORDER BY ts DESC LIMIT ?', params + [limit]).fetchall()
+            rows.reverse()
+        else:
+            rows = self.db.execute(query + ' ORDER BY ts', params).fetchall()
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    def append(self, device, variable, rows):
+        """
+        stores samples, already cached timestamps are skipped
+        :param rows: iterable of (timestamp (ms), value)
+        :return: number of new samples
+        """
+        with self.db:
+            return self._insert(device, variable, rows)
+
+    def _insert(self, device, variable, rows):
+        """
+        stores samples not cached yet and adds them to rollups, caller commits
+        :return: number of new samples
+        """
+        self.db.execute('DELETE FROM staging')
+        self.db.executemany('INSERT OR IGNORE INTO staging (ts, value) VALUES (?, ?)', rows)
+        self.db.execute('DELETE FROM staging WHERE EXISTS (SELECT 1 FROM samples '
+                        'WHERE device = ? AND variable = ? AND ts = staging.ts)', (device, variable))
+        new = self.db.execute('SELECT ts, value FROM staging ORDER BY ts').fetchall()
+        self.db.execute('INSERT INTO samples (device, variable, ts, value) SELECT ?, ?, ts, value FROM staging',
+                        (device, variable))
+        new = np.array(new, dtype=np.float64).reshape(-1, 2)
+        self.rollups.add(device, variable, new[:, 0].astype(np.int64), new[:, 1])
+        return len(new)
+
+    def completed_windows(self, device, variable):
+        """
+        :return: set of start timestamps of completely downloaded windows
+        """
+        rows = self.db.execute('SELECT start FROM downloads WHERE device = ? AND variable = ?',
+                               (device, variable)).fetchall()
+        return {row[0] for row in rows}
+
+    def append_window(self, device, variable, rows, start, end):
+        """
+        stores samples of downloaded window and marks window complete in one transaction
+        :param start, end: window bounds, as used by downloader
+        :return: number of new samples
+        """
+        with self.db:
+            new = self._insert(device, variable, rows)
+            self.db.execute('INSERT OR REPLACE INTO downloads (device, variable, start, end) VALUES (?, ?, ?, ?)',
+                            (device, variable, start, end))
+        return new
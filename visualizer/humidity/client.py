@@ -0,0 +1,58 @@
+# shared http client of the visualizer
+# one pooled session and thread pool per bokeh server process, used by all sessions
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+WORKERS = 8
+# connect, read timeout in seconds
+TIMEOUT = (5, 30)
+
+session = requests.Session()
+# keep-alive connections for every worker, per host
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=WORKERS)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+
+executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+# url: ETag, Last-Modified of its last response
+_validators = {}
+_lock = threading.Lock()
+
+
+def get(url, verbose=None, params=None, conditional=False, timeout=TIMEOUT):
+    """
+    :param conditional: sends validators of previous response of url (If-None-Match, If-Modified-Since),
+        server answers unchanged resource without body
+    :return: response body, None for unchanged resource (304 Not Modified or 204 No Content)
+    """
+    headers = {}
+    if conditional:
+        with _lock:
+            etag, modified = _validators.get(url, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+    response = session.get(url, params=params, headers=headers, timeout=timeout)
+    if verbose:
+        print(response.url)
+        print("status: ", response.status_code)
+    if response.status_code in (204, 304):
+        return None
+    response.raise_for_status()
+    if conditional:
+        with _lock:
+            _validators[url] = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    return response.content
+
+
+def map(func, items):
+    """
+    calls func for every item concurrently
+    :return: list of results in order of items
+    """
+    return list(executor.map(func, items))
@@ -0,0 +1,107 @@
+# level of detail reduction of long series for plotting
+# Pyramid keeps min/max reduced copies of a series at several resolutions and
+# picks the one that gives at most a couple of points per pixel of the plot
+import numpy as np
+
+
+def minmax_indices(y, bucket, first=0):
+    """
+    indices of minimum and maximum of every bucket of y, in time order
+    :param bucket: samples per bucket
+    :param first: index of the first sample of y in the whole series, added to result
+    :return: int64 array with two indices per bucket
+    """
+    n = len(y)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    buckets = -(-n // bucket)
+    padded = np.pad(y, (0, buckets * bucket - n), mode='edge').reshape(buckets, bucket)
+    offsets = np.arange(buckets, dtype=np.int64) * bucket
+    lo = np.minimum(offsets + padded.argmin(axis=1), n - 1)
+    hi = np.minimum(offsets + padded.argmax(axis=1), n - 1)
+    pairs = np.stack([np.minimum(lo, hi), np.maximum(lo, hi)], axis=1).reshape(-1)
+    return pairs + first
+
+
+class Pyramid:
+    """
+    min/max reduced levels of a series, level 0 is the series itself,
+    level k holds min and max of every factor ** k samples
+    """
+    def __init__(self, x, y, factor=4, min_points=1000):
+        self.factor = factor
+        self.min_points = min_points
+        self.x = np.asarray(x)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.levels = []  # per level: bucket size, indices into series
+        self._build()
+
+    def _build(self):
+        self.levels = [(1, None)]
+        bucket = self.factor
+        while 2 * len(self.y) // bucket >= self.min_points:
+            self.levels.append((bucket, minmax_indices(self.y, bucket)))
+            bucket *= self.factor
+
+    def append(self, x, y):
+        """
+        adds samples to the end of series, only last bucket of every level is recomputed
+        """
+        old = len(self.y)
+        self.x = np.concatenate([self.x, np.asarray(x, dtype=self.x.dtype)])
+        self.y = np.concatenate([self.y, np.asarray(y, dtype=np.float64)])
+        for k in range(1, len(self.levels)):
+            bucket, indices = self.levels[k]
+            first = old // bucket * bucket
+            tail = minmax_indices(self.y[first:], bucket, first)
+            self.levels[k] = (bucket, np.concatenate([indices[:2 * (old // bucket)], tail]))
+        if 2 * len(self.y) // (self.levels[-1][0] * self.factor) >= self.min_points:
+            self._build()
+
+    def drop(self, n):
+        """
+        removes n oldest samples, levels are rebuilt
+        """
+        # copies let the evicted part be freed
+        self.x = self.x[n:].copy()
+        self.y = self.y[n:].copy()
+        self._build()
+
+    def prepend(self, x, y):
+        """
+        adds older samples to the beginning of series, levels are rebuilt
+        """
+        self.x = np.concatenate([np.asarray(x, dtype=self.x.dtype), self.x])
+        self.y = np.concatenate([np.asarray(y, dtype=np.float64), self.y])
+        self._build()
+
+    def __len__(self):
+        return len(self.y)
+
+    def select(self, start, end, width):
+        """
+        reduced part of series between two x values
+        :param start, end: visible x range, same type as x values
+        :param width: plot width in pixels, at most 2 points per pixel are returned
+        :return: x, y arrays
+        """
+        first = np.searchsorted(self.x, start, side='left')
+        last = np.searchsorted(self.x, end, side='right')
+        picked = None
+        for bucket, indices in self.levels:
+            if bucket == 1:
+                if last - first <= 2 * width:
+                    return self.x[first:last], self.y[first:last]
+                continue
+            lo = np.searchsorted(indices, first, side='left')
+            hi = np.searchsorted(indices, last, side='left')
+            picked = indices[lo:hi]
+            if hi - lo <= 2 * width:
+                break
+        if picked is None:
+            # series too short for reduced levels, but too dense for plot width
+            picked = minmax_indices(self.y[first:last], -(-(last - first) // width), first)
+        elif len(picked) > 2 * width:
+            # coarsest level still too dense, reduce visible part once more
+            picked = picked[minmax_indices(self.y[picked], -(-len(picked) // width))]
+        return self.x[picked], self.y[picked]
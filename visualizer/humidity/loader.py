@@ -0,0 +1,75 @@
+# columnar parsing of downloaded history into numpy arrays
+# timestamps are int64 milliseconds as stored in cache (see cache.to_ms)
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def utc_offset(seconds):
+    local = datetime.fromtimestamp(seconds)
+    utc = datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+    return int((local - utc).total_seconds())
+
+
+def local_ms(epoch_ms):
+    """
+    epoch milliseconds to local time milliseconds, same as datetime.fromtimestamp(ts // 1000)
+    utc offset is looked up once per distinct hour, which keeps daylight saving transitions right
+    """
+    seconds = np.asarray(epoch_ms, dtype=np.int64) // 1000
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.array([utc_offset(int(h) * 3600) for h in hours], dtype=np.int64)
+    return (seconds + offsets[inverse.reshape(-1)]) * 1000
+
+
+def parse_ubidots(content):
+    """
+    parses ubidots values response, newest first as returned by ubidots
+    :param content: response body
+    :return: timestamps (ms, local time) and values, oldest first
+    """
+    results = loads(content)['results']
+    n = len(results)
+    ts = np.fromiter((each['timestamp'] for each in results), dtype=np.int64, count=n)
+    values = np.fromiter((each['value'] for each in results), dtype=np.float64, count=n)
+    return local_ms(ts[::-1]), values[::-1].copy()
+
+
+def parse_envdata(content, column=3, after=None):
+    """
+    parses /envdata response, rows of [id, iso timestamp, ...]
+    :param column: index of value in row
+    :param after: timestamp (ms), only newer rows are kept
+    :return: timestamps (ms) and values, in server order
+    """
+    ts, values = parse_envdata_columns(content, [column], after)
+    return ts, values[0]
+
+
+def parse_envdata_columns(content, columns, after=None):
+    """
+    parses several values of every /envdata row, response is decoded once
+    :param columns: indices of values in row
+    :return: timestamps (ms) and list of values per column
+    """
+    rows = loads(content)
+    # ascii bytes without trailing 'Z', numpy parses all timestamps in one pass
+    stamps = np.array([each[1][:-1] for each in rows], dtype='S')
+    values = [np.array([each[column] for each in rows], dtype=np.float64) for column in columns]
+    if after is not None and len(rows):
+        # iso strings compare in time order, filter before parsing
+        last_iso = np.datetime64(int(after), 'ms').astype(datetime).strftime(ISO_FORMAT)[:-1].encode()
+        newer = stamps > last_iso
+        stamps = stamps[newer]
+        values = [each[newer] for each in values]
+    ts = stamps.astype('datetime64[ms]').astype(np.int64)
+    return ts, values
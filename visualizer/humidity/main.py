@@ -1,121 +1,228 @@
-import requests
+import sys
 import time
+import numpy as np
 from os import path
 from datetime import datetime, date
+from collections import deque
 from bokeh.plotting import figure, output_file, show, ColumnDataSource, curdoc
-from bokeh.models import HoverTool, DateRangeSlider, DateSlider, RangeSlider, CustomJS
+from bokeh.models import HoverTool, DateRangeSlider, DateSlider, RangeSlider, Button, Select
 from bokeh.layouts import column
+from bokeh.palettes import Category10
 from bokeh.driving import count
 from m_file import ini2
 
+app_dir = path.dirname(path.realpath(__file__))
+sys.path.insert(0, app_dir)
+from cache import SampleCache, to_ms, from_ms
+import push
+import rollup
+from downsample import Pyramid
+from sources import Envdata, Ubidots
+
 
 output_file("humidity.html")
 
-config_path = path.join(path.dirname(path.realpath(__file__)), 'conf.json')
+config_path = path.join(app_dir, 'conf.json')
 config = ini2().read(config_path)
 print(config)
 
+cache = SampleCache(path.join(app_dir, config.get('cache', 'cache.sqlite')))
+
+# long range views, days before newest sample
+HISTORY_DAYS = {'week': 7, 'month': 30, 'year': 365}
 
-def get_data_ubidots(verbose=None, from_ubidots=True):
+
+def load_live(key):
     """
-    downloads all humidity data from ubidots
-    :return: source, source for view, initial graph state
+    loads part of cached series within retention
     """
-    if from_ubidots:
-        url = "https://industrial.api.ubidots.com/api/v1.6/devices/{}/{}/values/?token={}&page_size={}".\
-            format(config['device'], config['variable1'], config['token'], config['size'])
-    else:
-        # url = "http://192.168.0.14:5000/envdata"
-        url = "http://10.147.20.112:5000/envdata"
-    if verbose:
-        print(url)
-
-    request = requests.get(url)
-    status = request.status_code
-    if from_ubidots:
-        json_data = request.json()['results']  # ["results"]
-    else:
-        json_data = request.json()
-
-    print("status: ", status)
-    print("downloaded data length: ", len(json_data))
+    device, variable = key
+    last = cache.last_timestamp(device, variable)
+    live_window = config.get('live_window_s')
+    start = last - int(live_window * 1000) if live_window and last is not None else None
+    # 0 means no count limit, as in evict_count
+    ts, values = cache.load(device, variable, start=start, limit=config.get('live_points', 100000) or None)
+    return Pyramid(np.array(ts, dtype='datetime64[ms]'), np.array(values, dtype=np.float64))
 
-    time1 = []
-    value1 = []
-    for each in json_data:
-        if from_ubidots:
-            time1.append(datetime.fromtimestamp(each['timestamp']//1000))
-            value1.append(each['value'])
-        else:
-            time1.append(datetime.strptime(each[1], '%Y-%m-%dT%H:%M:%S.%fZ'))
-            value1.append(each[3])
 
-    if from_ubidots:
-        time1.reverse()
-        value1.reverse()
+def get_data_ubidots(verbose=None):
+    """
+    loads data of all series from local cache, downloads only samples newer than cached ones
+    live series in python are limited to retention (see evict_count), document holds only the visible part
+    :return: sources for view, initial graph state, level of detail pyramids, per key
+    """
+    lasts = [cache.last_timestamp(*key) for key in keys]
+    print('last cached timestamps: ', [from_ms(last) if last is not None else None for last in lasts])
+    for key, new in data_source.download(verbose).items():
+        print('new samples: ', key, new)
+
+    pyramids = {key: load_live(key) for key in keys}
+    time1 = pyramids[keys[0]].x
+    if not len(time1):
+        # nothing cached nor downloaded yet, view fills with first samples
+        print('no samples of ', keys[0])
+        sources = {key: ColumnDataSource(data=view_data(series.x, series.y)) for key, series in pyramids.items()}
+        return sources, (0, 0), pyramids
 
     print('first timestamp: ', time1[0], ' last timestamp: ', time1[-1])
 
     # initial graph data length
     initial_end = len(time1)-1
-    if len(time1) > 2880:
-        initial_start = initial_end - 2880
+    initial_points = config.get('initial_points', 2880)
+    if len(time1) > initial_points:
+        initial_start = initial_end - initial_points
     else:
         initial_start = 0  # index1[0]
     initial_state = (initial_start, initial_end)
 
-    # source = ColumnDataSource(data=dict(x=time1[:initial_end], y=value1[:initial_end], index=index1[:initial_end]))
-    # source_orig = ColumnDataSource(data=dict(x=time1, y=value1, index=index1))
-    source = ColumnDataSource(data=dict(x=time1[initial_start:], y=value1[initial_start:]))
-    source_orig = ColumnDataSource(data=dict(x=time1, y=value1))
+    sources = {}
+    for key, series in pyramids.items():
+        x, y = series.select(time1[initial_start], time1[initial_end], plot_width())
+        sources[key] = ColumnDataSource(data=view_data(x, y))
+
+    return sources, initial_state, pyramids
+
+
+def evict_count(x):
+    """
+    number of oldest samples outside of live retention
+    retention is given by config live_points (sample count) and live_window_s (seconds before newest sample)
+    """
+    n = 0
+    if len(x) == 0:
+        return n
+    live_points = config.get('live_points', 100000)
+    if live_points:
+        n = max(n, len(x) - live_points)
+    live_window = config.get('live_window_s')
+    if live_window:
+        oldest = x[-1] - np.timedelta64(int(live_window * 1000), 'ms')
+        n = max(n, int(np.searchsorted(x, oldest, side='left')))
+    return n
+
+
+def view_data(x, y):
+    """
+    column data for view source
+    datetimes go as float milliseconds, bokeh sends float arrays in binary form
+    """
+    return dict(x=x.astype('datetime64[ms]').astype(np.float64), y=y)
+
 
-    return source_orig, source, initial_state
+def plot_width():
+    """
+    plot width in pixels, at most two points per pixel are rendered
+    """
+    return config.get('plot_width', 1600)
 
 
-source_orig, source, initial_state = get_data_ubidots(verbose=1, from_ubidots=False)
+data_source = (Ubidots if config.get('from_ubidots', False) else Envdata)(config, cache)
+keys = data_source.keys
+sources, initial_state, pyramids = get_data_ubidots(verbose=1)
+# first series drives slider
+pyramid = pyramids[keys[0]]
 
 
-def create_plot(verbose=None):
+def create_plots(verbose=None):
     """
-    creates plot output to static HTML file
+    creates plot per variable with line per device, plots share x range
     :param verbose:
-    :return: plot
-    """
-    p = figure(title="humidity@krishotte", x_axis_label='x', y_axis_label='y',
-               #width=1600, height=800,
-               x_axis_type="datetime")
-
-    # add a line renderer with legend and line thickness
-    p.line('x', 'y', legend='humidity', line_width=1, source=source)
-
-    hover_tool = HoverTool(
-        tooltips=[
-            ('ts', '@x{%F %T}'),  # format timestamp
-            ('value', '@y')
-        ],
-        formatters={
-            'x': 'datetime',
-            'value': 'printf',
-        }
-    )
+    :return: list of plots
+    """
+    plots = []
+    devices = []
+    for device, variable in keys:
+        if device not in devices:
+            devices.append(device)
+    for variable in dict.fromkeys(variable for device, variable in keys):
+        linked = {'x_range': plots[0].x_range} if plots else {}
+        p = figure(title=variable + "@krishotte", x_axis_label='x', y_axis_label='y',
+                   #width=1600, height=800,
+                   x_axis_type="datetime", **linked)
+
+        # add a line renderer with legend and line thickness
+        for device in devices:
+            if (device, variable) in sources:
+                label = device.split(':')[-1] if len(devices) > 1 else variable
+                p.line('x', 'y', legend_label=label, line_width=1, source=sources[(device, variable)],
+                       color=Category10[10][devices.index(device) % 10])
+
+        hover_tool = HoverTool(
+            tooltips=[
+                ('ts', '@x{%F %T}'),  # format timestamp
+                ('value', '@y')
+            ],
+            formatters={
+                '@x': 'datetime',
+            }
+        )
+
+        p.add_tools(hover_tool)
+        p.sizing_mode = "stretch_both"
+        plots.append(p)
+
+    return plots
+
+
+def slider_title(start1, end1):
+    if not len(pyramid):
+        return 'no data'
+    return str(pyramid.x[start1]) + ",  " + str(pyramid.x[min(end1, len(pyramid) - 1)])
+
+
+def show_window(value):
+    """
+    pushes selected range reduced to plot resolution into view sources
+    """
+    start1 = int(value[0])
+    end1 = min(int(value[1]), len(pyramid) - 1)
+    slider2.title = slider_title(start1, end1)
+    if not len(pyramid):
+        return
+    for key, series in pyramids.items():
+        x, y = series.select(pyramid.x[start1], pyramid.x[end1], plot_width())
+        sources[key].data = view_data(x, y)
 
-    p.add_tools(hover_tool)
-    p.sizing_mode = "stretch_both"
 
-    return p
+def slider2_callback(attr, old, new):
+    # called once user releases slider, not on every move
+    show_live()
 
 
-def slider2_callback_2(source=source, window=None, source2=source_orig):
-    data = source2.data
-    start1 = cb_obj.value[0]
-    end1 = cb_obj.value[1]
-    x = data['x']
-    y = data['y']
-    x = x[start1:end1]
-    y = y[start1:end1]
-    cb_obj.title = source2.data['x'][start1] + ",  " + str(source2.data['x'][end1])
-    source.data = {'x': x, 'y': y}
-    source.change.emit()
+def show_live():
+    """
+    switches view back to slider window of live series
+    """
+    if history.value != 'live':
+        # history callback shows window
+        history.value = 'live'
+    else:
+        show_window(slider2.value)
+
+
+def show_history(days):
+    """
+    shows last days of every cached series from rollups (see rollup.Rollups),
+    raw samples are loaded only when range is too short for rollups
+    """
+    for key in keys:
+        end = cache.last_timestamp(*key)
+        if end is None:
+            continue
+        start = end - days * rollup.DAY
+        envelope = cache.rollups.envelope(key[0], key[1], start, end, plot_width())
+        if envelope is None:
+            ts, values = cache.load(key[0], key[1], start=start, end=end)
+            series = Pyramid(np.array(ts, dtype='datetime64[ms]'), values)
+            envelope = series.select(series.x[0], series.x[-1], plot_width())
+        sources[key].data = view_data(*envelope)
+
+
+def history_callback(attr, old, new):
+    if new == 'live':
+        show_window(slider2.value)
+    else:
+        show_history(HISTORY_DAYS[new])
 
 
 def create_slider(initial_state, verbose=None):
@@ -124,83 +231,161 @@ def create_slider(initial_state, verbose=None):
     """
     slider2 = RangeSlider(
         start=0,
-        end=len(source_orig.data['x']),
+        end=len(pyramid),
         value=(initial_state[0], initial_state[1]),
         step=1,
-        title=str(source_orig.data['x'][initial_state[0]]) + ", " + str(source_orig.data['x'][initial_state[1]]),
-        callback=CustomJS.from_py_func(slider2_callback_2)
+        title=slider_title(initial_state[0], initial_state[1])
     )
-    # slider2.on_change('value', slider2_callback)
+    slider2.on_change('value_throttled', slider2_callback)
     return slider2
 
 
-p = create_plot()
+def load_older():
+    """
+    loads samples older than live series from cache on demand
+    view moves to the beginning of loaded part, they stay until view follows new data again
+    """
+    size = len(pyramid)
+    for key, series in pyramids.items():
+        first = int(series.x[0].astype('datetime64[ms]').astype(np.int64)) if len(series) else None
+        ts, values = cache.load(key[0], key[1], end=first - 1 if first is not None else None,
+                                limit=config.get('older_points', 100000))
+        print('older samples: ', key, len(ts))
+        if ts:
+            series.prepend(np.array(ts, dtype='datetime64[ms]'), values)
+    n = len(pyramid) - size
+    if not n:
+        return
+    window = slider2.value[1] - slider2.value[0]
+    slider2.end = slider2.end + n
+    slider2.value = (0, min(window, len(pyramid) - 1))
+    show_live()
+
+
+def evict():
+    """
+    drops samples outside of retention from live series, keeps slider on the same samples
+    eviction waits for 10 % of series so levels are not rebuilt on every sample
+    """
+    evicted = False
+    for key, series in pyramids.items():
+        n = evict_count(series.x)
+        if n <= len(series) // 10:
+            continue
+        print('evicting samples: ', key, n)
+        series.drop(n)
+        evicted = True
+        if series is pyramid:
+            slider2.end = slider2.end - n
+            start1, end1 = max(slider2.value[0] - n, 0), max(slider2.value[1] - n, 0)
+            slider2.value = (start1, end1)
+    if evicted and history.value == 'live':
+        show_window(slider2.value)
+
+
+plots = create_plots()
 slider2 = create_slider(initial_state)
-layout1 = column(p, slider2)
+older_button = Button(label='older data')
+older_button.on_click(load_older)
+history = Select(title='range', value='live', options=['live'] + list(HISTORY_DAYS))
+history.on_change('value', history_callback)
+layout1 = column(*plots, slider2, older_button, history)
 layout1.sizing_mode = "scale_width"
 
 
-@count()
-def update(t):
-    last_data = get_new_data(from_ubidots=False)
-    print('last data', last_data)
-
-    print('last valid timestamp: ', source_orig.data['x'][-1])
-
-    if last_data[0] > source_orig.data['x'][-1]:
-        print('we have new data...')
-        new_data = dict(x=[last_data[0]], y=[last_data[1]])
-        print('new data: ', new_data)
-
-        print('slider end: ', slider2.value[1], ' len data: ', len(source_orig.data['x']))
-
-        print('slider size: ', slider2.value[1])
-        slider2.end = slider2.end + 1
+def add_sample(key, timestamp, value):
+    """
+    appends sample newer than series to cache and pyramid
+    :return: True for new sample
+    """
+    series = pyramids[key]
+    if len(series) and np.datetime64(timestamp, 'ms') <= series.x[-1]:
+        return False
+    cache.append(key[0], key[1], [(to_ms(timestamp), value)])
+    series.append(np.array([timestamp], dtype='datetime64[ms]'), np.array([value]))
+    return True
 
-        if slider2.value[1] >= len(source_orig.data['x']) - 1:
-            slider_selected_length = slider2.value[1] - slider2.value[0]
 
-            slider2.value = (slider2.value[0] + 1, slider2.value[1] + 1)
+def add_samples(samples):
+    """
+    appends new samples to displayed series, view follows them when it shows the newest ones
+    :param samples: list of (key, timestamp, value)
+    """
+    print('last valid timestamp: ', pyramid.x[-1] if len(pyramid) else None)
 
-            print('updating source.stream')
-            source.stream(new_data)
+    size = len(pyramid)
+    at_end = slider2.value[1] >= size - 1
+    new = [each for each in samples if add_sample(*each)]
+    if new:
+        print('we have new data...')
+        print('new data: ', new)
+
+        print('slider end: ', slider2.value[1], ' len data: ', size)
+        n = len(pyramid) - size
+        slider2.end = slider2.end + n
+
+        if at_end:
+            # view follows new data
+            print('updating view')
+            # window of short series, also of series empty at start, grows up to initial points
+            grow = slider2.value[0] == 0 and len(pyramid) <= config.get('initial_points', 2880)
+            start1, end1 = 0 if grow else slider2.value[0] + n, slider2.value[1] + n
+            slider2.value = (start1, end1)
+            slider2.title = slider_title(start1, end1)
+            start, end = pyramid.x[start1], pyramid.x[min(end1, len(pyramid) - 1)]
+            # history view is not changed by new samples
+            if history.value == 'live':
+                for key, timestamp, value in new:
+                    series = pyramids[key]
+                    first = np.searchsorted(series.x, start, side='left')
+                    last = np.searchsorted(series.x, end, side='right')
+                    if last - first <= 2 * plot_width():
+                        # raw samples shown, window moves by one sample
+                        x = np.array([timestamp], dtype='datetime64[ms]')
+                        rollover = None if grow else len(sources[key].data['x'])
+                        sources[key].stream(view_data(x, np.array([value])), rollover=rollover)
+                    else:
+                        sources[key].data = view_data(*series.select(start, end, plot_width()))
+            # only live view is bounded, history loaded on demand stays while browsed
+            evict()
 
-        source_orig.stream(new_data)
 
+@count()
+def update(t):
+    since = [int(pyramids[key].x[-1].astype(np.int64)) if len(pyramids[key]) else None for key in keys]
+    last_data = data_source.latest(since)
+    print('last data', last_data)
+    add_samples(last_data)
 
-def get_new_data(from_ubidots=True):
-    if from_ubidots:
-        url = "https://industrial.api.ubidots.com/api/v1.6/devices/{}/{}/values/?token={}&page_size={}". \
-            format(config['device'], config['variable1'], config['token'], 2)
-    else:
-        # url = "http://192.168.0.14:5000/envdata-last"
-        url = "http://10.147.20.112:5000/envdata-last"
-    # print(url)
 
-    request = requests.get(url)
-    status = request.status_code
-    # print("status: ", status)
+def subscribe_updates(doc):
+    """
+    receives new samples pushed by ingest server instead of polling
+    stream runs in background thread, samples are queued in arrival order and applied on session's next tick
+    """
+    pending = deque()
 
-    if from_ubidots:
-        json_data = request.json()['results']  # ["results"]
-    else:
-        json_data = request.json()
-    # print("data: ", json_data)
+    def apply_pending():
+        while pending:
+            add_samples(pending.popleft())
 
-    if from_ubidots:
-        last_timestamp = datetime.fromtimestamp(json_data[0]['timestamp'] // 1000)
-        # print("last timestamp: ", last_timestamp)
-        last_value = json_data[0]['value']
-    else:
-        last_timestamp = datetime.strptime(json_data[1], '%Y-%m-%dT%H:%M:%S.%fZ')
-        last_value = json_data[4]
+    def on_event(row):
+        pending.append(data_source.parse_last(row))
+        doc.add_next_tick_callback(apply_pending)
 
-    return last_timestamp, last_value
+    unsubscribe = push.subscribe(config['push_url'], on_event)
+    doc.on_session_destroyed(lambda session_context: unsubscribe())
 
 
 # show the results
 curdoc().add_root(layout1)
-curdoc().add_periodic_callback(update, 4000)
+if config.get('push_url') and isinstance(data_source, Envdata):
+    subscribe_updates(curdoc())
+else:
+    if config.get('push_url'):
+        # stream sends /envdata-last rows of ingest server, ubidots has none
+        print('push_url needs envdata source, ubidots is polled')
+    curdoc().add_periodic_callback(update, 4000)
 curdoc().title = 'humidity'
 
 
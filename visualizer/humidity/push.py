@@ -0,0 +1,84 @@
+# push delivery of new samples from ingest server (server-sent events)
+# one upstream connection per url is shared by all sessions of the bokeh server process,
+# this module is imported once per process while the app script runs once per session
+import json
+import threading
+import time
+
+import requests
+import urllib3
+
+# connect, read timeout in seconds, stream idle for longer is reconnected
+TIMEOUT = (5, 60)
+
+_lock = threading.Lock()
+_subscriptions = {}
+
+
+class Subscription(threading.Thread):
+    """
+    reads event stream from url and hands every event to all subscribers
+    reconnects with growing delay when connection fails
+    """
+    def __init__(self, url):
+        super().__init__(daemon=True)
+        self.url = url
+        self.callbacks = []
+
+    def run(self):
+        delay = 1
+        while True:
+            try:
+                with requests.get(self.url, stream=True, timeout=TIMEOUT,
+                                  headers={'Accept': 'text/event-stream'}) as response:
+                    response.raise_for_status()
+                    delay = 1
+                    self.read_events(response)
+            # body is read from raw stream, its read timeout and reset are raised by urllib3 unwrapped
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError, ValueError) as e:
+                print('event stream error: ', self.url, e)
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def read_events(self, response):
+        data = []
+        # iter_lines waits for full chunk, readline returns as soon as line is complete
+        for line in iter(response.raw.readline, b''):
+            line = line.decode('utf-8').rstrip('\r\n')
+            if line:
+                if line.startswith('data:'):
+                    data.append(line[5:].lstrip())
+                # other fields and ':' keep-alive comments are ignored
+                continue
+            # empty line ends event
+            if data:
+                self.dispatch(json.loads('\n'.join(data)))
+                data = []
+
+    def dispatch(self, event):
+        with _lock:
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print('event callback error: ', e)
+
+
+def subscribe(url, callback):
+    """
+    calls callback(event) from background thread for every event sent by url
+    event is the decoded json of the data field
+    :return: function removing the subscription
+    """
+    with _lock:
+        subscription = _subscriptions.get(url)
+        if subscription is None:
+            subscription = _subscriptions[url] = Subscription(url)
+            subscription.start()
+        subscription.callbacks.append(callback)
+
+    def unsubscribe():
+        with _lock:
+            subscription.callbacks.remove(callback)
+    return unsubscribe
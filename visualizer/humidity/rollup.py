@@ -0,0 +1,119 @@
+# pre-aggregated statistics of cached series at minute, hour and day resolution
+# rollups are kept in the cache database, SampleCache adds every batch of new samples to them,
+# samples skipped as already cached are not added, so history is never rescanned
+import numpy as np
+
+from downsample import minmax_indices
+
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+# finest first, bucket lengths in ms
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+
+_UPSERT = '''
+    INSERT INTO rollups (device, variable, resolution, bucket, min, max, sum, count, last_ts, last)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (device, variable, resolution, bucket) DO UPDATE SET
+        min = min(min, excluded.min), max = max(max, excluded.max),
+        sum = sum + excluded.sum, count = count + excluded.count,
+        last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+        last_ts = max(last_ts, excluded.last_ts)
+'''
+
+
+class Rollups:
+    """
+    min, max, mean, count and last value of every bucket per device, variable and resolution
+    :param db: sqlite connection of SampleCache
+    """
+    def __init__(self, db):
+        self.db = db
+        created = self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollups'").fetchone() is None
+        self.db.execute('CREATE TABLE IF NOT EXISTS rollups ('
+                        'device TEXT, variable TEXT, resolution INTEGER, bucket INTEGER, '
+                        'min REAL, max REAL, sum REAL, count INTEGER, last_ts INTEGER, last REAL, '
+                        'PRIMARY KEY (device, variable, resolution, bucket)) WITHOUT ROWID')
+        if created:
+            # cache filled before rollups existed
+            self.rebuild()
+        self.db.commit()
+
+    def add(self, device, variable, ts, values):
+        """
+        adds new samples to buckets, only buckets touched by them are updated
+        :param ts: timestamps (ms) ordered by time, not cached before
+        :param values: values as numpy arrays
+        """
+        if len(ts) == 0:
+            return
+        for resolution in RESOLUTIONS:
+            buckets = ts - ts % resolution
+            first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            last = np.r_[first[1:], len(ts)] - 1
+            self.db.executemany(_UPSERT, zip(
+                [device] * len(first), [variable] * len(first), [resolution] * len(first),
+                buckets[first].tolist(),
+                np.minimum.reduceat(values, first).tolist(), np.maximum.reduceat(values, first).tolist(),
+                np.add.reduceat(values, first).tolist(), (last - first + 1).tolist(),
+                ts[last].tolist(), values[last].tolist()))
+
+    def rebuild(self):
+        """
+        computes all rollups from cached samples
+        """
+        self.db.execute('DELETE FROM rollups')
+        for resolution in RESOLUTIONS:
+            self.db.execute('INSERT INTO rollups '
+                            'SELECT device, variable, ?, ts - ts % ?, MIN(value), MAX(value), SUM(value), COUNT(*), '
+                            'MAX(ts), NULL FROM samples GROUP BY device, variable, ts - ts % ?',
+                            (resolution, resolution, resolution))
+        self.db.execute('UPDATE rollups SET last = (SELECT value FROM samples WHERE samples.device = rollups.device '
+                        'AND samples.variable = rollups.variable AND samples.ts = rollups.last_ts)')
+
+    def query(self, device, variable, resolution, start=None, end=None):
+        """
+        buckets of series ordered by time
+        :param start, end: timestamps (ms), buckets starting within range are returned
+        :return: dict of numpy arrays bucket (ms), min, max, mean, count, last
+        """
+        query = 'SELECT bucket, min, max, sum, count, last FROM rollups WHERE device = ? AND variable = ? ' \
+                'AND resolution = ?'
+        params = [device, variable, resolution]
+        if start is not None:
+            query += ' AND bucket >= ?'
+            params.append(start - start % resolution)
+        if end is not None:
+            query += ' AND bucket <= ?'
+            params.append(end)
+        rows = np.array(self.db.execute(query + ' ORDER BY bucket', params).fetchall(), dtype=np.float64)
+        rows = rows.reshape(-1, 6)
+        return dict(bucket=rows[:, 0].astype(np.int64), min=rows[:, 1], max=rows[:, 2],
+                    mean=rows[:, 3] / np.maximum(rows[:, 4], 1), count=rows[:, 4].astype(np.int64), last=rows[:, 5])
+
+    def resolution(self, start, end, points):
+        """
+        coarsest resolution with at least points buckets in range, None when even finest one has less
+        and raw samples should be used
+        """
+        for resolution in reversed(RESOLUTIONS):
+            if (end - start) // resolution >= points:
+                return resolution
+        return None
+
+    def envelope(self, device, variable, start, end, width):
+        """
+        min and max of every bucket of coarsest resolution satisfying plot width, in time order
+        :return: x (ms), y arrays, at most 2 points per pixel, None when range needs raw samples
+        """
+        resolution = self.resolution(start, end, width)
+        if resolution is None:
+            return None
+        stats = self.query(device, variable, resolution, start, end)
+        # min at bucket start, max at its middle, line shows range of every bucket
+        x = np.stack([stats['bucket'], stats['bucket'] + resolution // 2], axis=1).reshape(-1)
+        y = np.stack([stats['min'], stats['max']], axis=1).reshape(-1)
+        if len(y) > 2 * width:
+            picked = minmax_indices(y, -(-len(y) // width))
+            x, y = x[picked], y[picked]
+        return x, y
@@ -0,0 +1,126 @@
+# data sources of the visualizer behind one interface, all requests go through shared client
+# Envdata is the local ingest server, Ubidots the cloud api
+# keys: cache keys (device, variable) of displayed series, first one drives slider
+# download(): stores history newer than cached into cache, only newer history is requested
+# latest(since): newest samples as (key, timestamp, value), only ones newer than since are requested
+import time
+from datetime import datetime
+
+import client
+import loader
+import ubidots
+from cache import from_ms
+
+
+class Envdata:
+    """
+    local ingest server, single device, every row holds all variables
+    """
+    # value index of variable in /envdata and /envdata-last rows, config columns and last_columns override them
+    COLUMNS = {'temperature': 2, 'humidity': 3, 'pressure': 4}
+    LAST_COLUMNS = {'temperature': 2, 'pressure': 3, 'humidity': 4}
+
+    def __init__(self, config, cache):
+        self.config = config
+        self.cache = cache
+        # self.url = "http://192.168.0.14:5000"
+        self.url = config.get('envdata_url', "http://10.147.20.112:5000")
+        self.keys = [('envdata', variable) for variable in config.get('variables', [config['variable1']])]
+
+    def column(self, variable, last=False):
+        columns = dict(self.LAST_COLUMNS if last else self.COLUMNS)
+        columns.update(self.config.get('last_columns' if last else 'columns', {}))
+        return columns[variable]
+
+    def download(self, verbose=None):
+        """
+        response holds all variables, it is downloaded and parsed once
+        request carries since=<newest cached timestamp>, only newer rows are sent,
+        rows are filtered again for servers ignoring it
+        :return: number of new samples per key
+        """
+        lasts = [self.cache.last_timestamp(*key) for key in self.keys]
+        after = None if None in lasts else min(lasts)
+        params = None
+        if after is not None:
+            params = {'since': from_ms(after).strftime(loader.ISO_FORMAT)}
+        content = client.get(self.url + '/envdata', verbose, params=params)
+        if content is None:
+            # nothing newer
+            return {key: 0 for key in self.keys}
+        ts, values = loader.parse_envdata_columns(content, [self.column(variable) for device, variable in self.keys],
+                                                  after)
+        print("downloaded data length: ", len(ts))
+        return {key: self.cache.append(key[0], key[1], zip(ts.tolist(), each.tolist()))
+                for key, each in zip(self.keys, values)}
+
+    def latest(self, since):
+        """
+        row of /envdata-last, request carries since=<newest known timestamp> and validators of previous response,
+        server with nothing newer answers without body
+        :param since: newest known timestamp (ms) or None, per key
+        :return: list of (key, timestamp, value), empty when nothing changed
+        """
+        params = None
+        if None not in since:
+            params = {'since': from_ms(min(since)).strftime(loader.ISO_FORMAT)}
+        content = client.get(self.url + '/envdata-last', params=params, conditional=True)
+        if content is None:
+            return []
+        return self.parse_last(loader.loads(content))
+
+    def parse_last(self, row):
+        """
+        :param row: /envdata-last row, also sent by push stream
+        :return: list of (key, timestamp, value)
+        """
+        timestamp = datetime.strptime(row[1], loader.ISO_FORMAT)
+        return [(key, timestamp, row[self.column(key[1], last=True)]) for key in self.keys]
+
+
+class Ubidots:
+    """
+    ubidots api, every device and variable is separate series
+    """
+    def __init__(self, config, cache):
+        self.config = config
+        self.cache = cache
+        variables = config.get('variables', [config['variable1']])
+        self.keys = [(ubidots.PREFIX + device, variable)
+                     for device in config.get('devices', [config['device']]) for variable in variables]
+
+    def download(self, verbose=None):
+        """
+        history is downloaded by time windows, concurrently and resumable (see ubidots.Downloader)
+        :return: number of new samples per key
+        """
+        downloader = ubidots.Downloader(self.cache, self.config['token'], client.session, client.executor,
+                                        page_size=self.config.get('page_size', 1000),
+                                        rate=self.config.get('ubidots_rate', 4))
+        first = int(time.time() * 1000) - self.config.get('history_days', 3 * 365) * ubidots.DAY_MS
+        new, failed = downloader.download(self.keys, first)
+        if failed:
+            print('failed windows: ', failed, ', they are downloaded next time')
+        return new
+
+    def latest(self, since):
+        """
+        newest value of every series, requested concurrently with start after newest known one,
+        unchanged series answer with empty page
+        :param since: newest known timestamp (ms) or None, per key
+        :return: list of (key, timestamp, value)
+        """
+        def last_value(key_since):
+            (device, variable), last = key_since
+            params = {'token': self.config['token'], 'page_size': 1}
+            if last is not None:
+                # cached timestamps are local time, ubidots expects epoch ms
+                params['start'] = int(time.mktime(from_ms(last).timetuple())) * 1000 + 1
+            url = ubidots.URL.format(device[len(ubidots.PREFIX):], variable)
+            results = loader.loads(client.get(url, params=params))['results']
+            if not results:
+                return []
+            last_timestamp = datetime.fromtimestamp(results[0]['timestamp'] // 1000)
+            return [((device, variable), last_timestamp, results[0]['value'])]
+
+        return [each for found in client.map(last_value, zip(self.keys, since)) for each in found]
@@ -0,0 +1,113 @@
+# local stand-in for the live endpoints of the ingest server, for testing updates without the device
+# a new sample in /envdata-last row format is made every interval seconds
+# /envdata-stream pushes every sample as server-sent event
+# /envdata-last answers 204 when since=<iso timestamp> is not older than newest sample
+# and 304 when If-None-Match holds ETag of newest sample
+# python sse_standin.py [port] [interval]
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+class Samples(threading.Thread):
+    """
+    makes new sample every interval, handlers wait for it on condition
+    """
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.row = None
+
+    def run(self):
+        i = 0
+        while True:
+            i += 1
+            row = [i, datetime.now(timezone.utc).strftime(ISO_FORMAT),
+                   round(random.uniform(20, 25), 2), round(random.uniform(980, 1020), 2),
+                   round(random.uniform(40, 60), 2)]
+            with self.condition:
+                self.row = row
+                self.condition.notify_all()
+            time.sleep(self.interval)
+
+    def next(self, row):
+        """
+        waits for sample newer than row
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.row is not row)
+            return self.row
+
+
+class Handler(BaseHTTPRequestHandler):
+    samples = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/envdata-stream':
+            self.stream()
+        elif url.path == '/envdata-last':
+            self.last({key: value[0] for key, value in parse_qs(url.query).items()})
+        else:
+            self.send_error(404)
+
+    def last(self, query):
+        row = self.samples.next(None)
+        etag = '"{}"'.format(row[0])
+        if 'since' in query and query['since'] >= row[1]:
+            self.send_response(204)
+        elif self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+        else:
+            body = json.dumps(row).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        row = None
+        try:
+            while True:
+                row = self.samples.next(row)
+                self.wfile.write('data: {}\n\n'.format(json.dumps(row)).encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=5001, interval=2.0):
+    Handler.samples = Samples(interval)
+    Handler.samples.start()
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5001
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    print('serving http://127.0.0.1:{}/envdata-stream and /envdata-last'.format(port))
+    serve(port, interval).serve_forever()
@@ -0,0 +1,157 @@
+# paginated history download from ubidots values api
+# history is split into time windows aligned to epoch, so every run splits it the same way
+# windows are downloaded concurrently within rate limit, every complete window is stored
+# together with its checkpoint, interrupted download continues with missing windows only
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import requests
+
+import loader
+
+URL = "https://industrial.api.ubidots.com/api/v1.6/devices/{}/{}/values/"
+# cache device key prefix of ubidots series
+PREFIX = 'ubidots:'
+DAY_MS = 24 * 3600 * 1000
+
+
+class RateLimit:
+    """
+    token bucket shared by download threads
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        waits until request may be sent
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.time) * self.rate)
+                self.time = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RetryError(Exception):
+    pass
+
+
+class Downloader:
+    """
+    downloads history of ubidots series into sample cache
+    :param cache: SampleCache, keeps samples and completed windows
+    :param session: requests session, pooled connections are reused by all pages
+    :param executor: thread pool downloading windows
+    :param window_ms: length of time window
+    :param rate: requests per second
+    :param attempts: tries per page, failed page is retried after backoff * 2 ** try seconds
+    """
+    def __init__(self, cache, token, session=None, executor=None, url=URL, window_ms=7 * DAY_MS,
+                 page_size=1000, rate=4, attempts=5, backoff=1.0):
+        self.cache = cache
+        self.token = token
+        self.session = session or requests.Session()
+        self.executor = executor or ThreadPoolExecutor(max_workers=4)
+        self.url = url
+        self.window_ms = window_ms
+        self.page_size = page_size
+        self.rate = RateLimit(rate)
+        self.attempts = attempts
+        self.backoff = backoff
+
+    def windows(self, first, end):
+        """
+        :param first, end: epoch ms
+        :return: list of (start, end) windows covering first .. end, end exclusive
+        """
+        start = first // self.window_ms * self.window_ms
+        return [(each, each + self.window_ms) for each in range(start, end, self.window_ms)]
+
+    def get_page(self, device, variable, start, end, page):
+        """
+        :return: decoded page, retried on connection errors, rate limiting and server errors
+        """
+        params = {'token': self.token, 'page_size': self.page_size, 'page': page, 'start': start, 'end': end - 1}
+        for attempt in range(self.attempts):
+            self.rate.acquire()
+            try:
+                response = self.session.get(self.url.format(device, variable), params=params, timeout=30)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise RetryError('status {}'.format(response.status_code))
+                response.raise_for_status()
+                return response.content
+            except (RetryError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.attempts - 1:
+                    raise
+                print('page failed, retrying: ', device, variable, start, page, e)
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def get_window(self, device, variable, start, end):
+        """
+        downloads all pages of window
+        :return: timestamps (ms, local time), values
+        """
+        ts = []
+        values = []
+        page = 1
+        while True:
+            content = self.get_page(device, variable, start, end, page)
+            page_ts, page_values = loader.parse_ubidots(content)
+            ts.append(page_ts)
+            values.append(page_values)
+            # short page is the last one
+            if len(page_ts) < self.page_size:
+                break
+            page += 1
+        return np.concatenate(ts), np.concatenate(values)
+
+    def download(self, keys, first, end=None):
+        """
+        downloads windows of series not completed yet
+        window reaching into future is stored but not marked complete, it is downloaded again next time
+        :param keys: cache keys (PREFIX + device, variable)
+        :param first: epoch ms of history start
+        :param end: epoch ms, default now
+        :return: number of new samples per key, number of failed windows
+        """
+        if end is None:
+            end = int(time.time() * 1000)
+        now = int(time.time() * 1000)
+        futures = {}
+        for key in keys:
+            done = self.cache.completed_windows(*key)
+            for start, stop in self.windows(first, end):
+                if start not in done:
+                    future = self.executor.submit(self.get_window, key[0][len(PREFIX):], key[1], start, stop)
+                    futures[future] = key, start, stop
+        print('windows to download: ', len(futures))
+
+        new = dict.fromkeys(keys, 0)
+        failed = 0
+        # results are stored from this thread, sqlite connection is not shared between threads
+        for future in as_completed(futures):
+            key, start, stop = futures[future]
+            try:
+                ts, values = future.result()
+            except (RetryError, requests.RequestException) as e:
+                print('window failed: ', key, start, e)
+                failed += 1
+                continue
+            rows = zip(ts.tolist(), values.tolist())
+            if stop <= now:
+                new[key] += self.cache.append_window(key[0], key[1], rows, start, stop)
+            else:
+                new[key] += self.cache.append(key[0], key[1], rows)
+        return new, failed
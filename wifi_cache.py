@@ -0,0 +1,41 @@
+# access point of last successful connection kept in RTC memory across deep sleep
+# connecting with known bssid and channel skips the scan on wakeup
+
+import ustruct
+import rtcmem
+
+_MAGIC = 0x5746
+_FORMAT = '<HH6sB'  # magic, ssid checksum, bssid, channel
+_SIZE = ustruct.calcsize(_FORMAT)
+_NO_BSSID = bytes(6)
+
+
+def _checksum(ssid):
+    """
+    cached access point is used only for the same ssid
+    """
+    s = 0
+    for c in ssid.encode():
+        s = (s * 31 + c) & 0xFFFF
+    return s
+
+
+def load(ssid):
+    """
+    :return: (bssid, channel) of last connection to ssid or None, bssid is None when only channel is known
+    """
+    magic, checksum, bssid, channel = ustruct.unpack_from(_FORMAT, rtcmem.read(rtcmem.WIFI_OFFSET, _SIZE), 0)
+    if magic != _MAGIC or checksum != _checksum(ssid):
+        return None
+    return (None if bssid == _NO_BSSID else bssid), channel
+
+
+def save(ssid, bssid, channel):
+    """
+    :param bssid: None when not known, connection is then pinned to channel only
+    """
+    rtcmem.write(rtcmem.WIFI_OFFSET, ustruct.pack(_FORMAT, _MAGIC, _checksum(ssid), bssid or _NO_BSSID, channel))
+
+
+def clear():
+    rtcmem.write(rtcmem.WIFI_OFFSET, bytes(_SIZE))